@@ -2,19 +2,33 @@
 import os
 from dotenv import load_dotenv, find_dotenv
 import streamlit as st
-from langchain_openai import ChatOpenAI
 from operator import itemgetter
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from audio_recorder_streamlit import audio_recorder
-from openai import OpenAI
 from streamlit_option_menu import option_menu
 from datetime import datetime
-import io
+import time
+import asyncio
+from memory_updater import write_file_atomic
+from memory_store import get_relevant_sections, parse_legacy_memory, parse_operations
+from chat_history import ChatHistory, count_message_tokens, count_tokens
+from greeting_cache import GreetingCache, get_fallback_greeting, get_greeting_key
+from audio_utils import compress_wav, get_audio_hash
+from speech_pipeline import iter_sentences, join_wav, pcm_to_wav, play_in_order, synthesize_in_order
+from resources import get_http_client, get_http_async_client, get_openai_client, get_service
+from assistant_service import ServiceBusy
+from telemetry import TELEMETRY, profile_request
+from debug_panel import PROFILES_DIR, is_profiling, show_debug_panel
+# LangChain, the OpenAI SDK and the audio recorder are imported by the functions that use them,
+# the page is drawn before they are loaded and the chat tab never loads the recorder
 
 # Get the project name to use in path variables
 project_folder_name = os.path.basename(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))  # Three levels up
 
+# User whose memory is used when no other name is given, the memory of the old shared text file is imported into it
+DEFAULT_USER = "default"
+
+# Recordings are downmixed and resampled before they are uploaded for transcription
+COMPRESS_AUDIO = True
+
 # Env
 load_dotenv(find_dotenv())
 OPENAI_API_KEY = os.environ['OPENAI_API_KEY']
@@ -26,14 +40,6 @@ def main():
     st.set_page_config(page_title="LangChain Chat Assistant 🦜", layout="wide")
     st.title("Try Out - LangChain Chat Assistant 🦜")
     
-    # LLM
-    LLM = ChatOpenAI(
-        temperature=0, 
-        model="gpt-4o-mini", 
-        openai_api_key=OPENAI_API_KEY, 
-        streaming=True
-    )
-
     with st.sidebar:
         # Language Selection Dropdown
         if 'language' not in st.session_state:
@@ -43,7 +49,15 @@ def main():
         if selected_language:
             st.session_state['language'] = selected_language
 
-    history_chat_context = []
+        # Every user has its own memory, the chats of the previous user are cleared when it changes
+        user_id = st.text_input("User", value=st.session_state.get("user_id", DEFAULT_USER)).strip() or DEFAULT_USER
+        if user_id != st.session_state.get("user_id"):
+            for key in ["messages1", "messages2", "messages1_history", "messages2_history"]:
+                st.session_state.pop(key, None)
+            st.session_state["user_id"] = user_id
+
+    show_debug_panel()
+
     tab_selected = ""
 
     if "chat_history" not in st.session_state:
@@ -52,8 +66,8 @@ def main():
     if "user_memory" not in st.session_state:
         st.session_state["user_memory"] = ""
 
-    if "audio_bytes" not in st.session_state:
-        st.session_state["audio_bytes"] = ""
+    if "audio_hash" not in st.session_state:
+        st.session_state["audio_hash"] = ""
 
     selected = option_menu(
         menu_title = None,
@@ -63,28 +77,30 @@ def main():
         orientation= "horizontal"
     )
 
+    # Memory updates run in the background, an error of the last one is shown here
+    memory_error = get_service().get_job_error(user_id, "memory")
+    if memory_error:
+        st.warning(f"The last user memory update failed: {memory_error}")
+
+    memory_store = get_memory_store(user_id)
+
     if selected == "Chat":
         tab_selected = "messages1"
-        with open(os.path.join("..", project_folder_name, "data", "user-memory", "user-memory.txt"), 'r') as doc:
-                user_memory = doc.read()
+        user_memory = memory_store.render()
         # If there are no messages in the chat then we add the assistant message
-        if tab_selected not in st.session_state:
-            st.session_state[tab_selected] = [{"role": "assistant", "content": start_message_chat(LLM, user_memory, selected_language)}]
-            history_chat_context += st.session_state[tab_selected]
+        add_greeting(user_id, user_memory, selected_language, tab_selected)
         # We show the messages in the chat message component from streamlit
         for msg in st.session_state.messages1:
             st.chat_message(msg["role"]).write(msg["content"])
 
     if selected == "Voice":
         tab_selected = "messages2"
-        with open(os.path.join("..", project_folder_name, "data", "user-memory", "user-memory.txt"), 'r') as doc:
-                user_memory = doc.read()
+        user_memory = memory_store.render()
         # If there are no messages in the chat then we add the assistant message
-        if tab_selected not in st.session_state:
-            st.session_state[tab_selected] = [{"role": "assistant", "content": start_message_chat(LLM, user_memory, selected_language)}]
-            history_chat_context += st.session_state[tab_selected]
+        add_greeting(user_id, user_memory, selected_language, tab_selected)
 
         '''Click the microphone icon to start recording; click again to stop.'''
+        from audio_recorder_streamlit import audio_recorder
         audio_bytes = audio_recorder(
             pause_threshold=3.0,
             text="Record button ->",
@@ -92,18 +108,27 @@ def main():
             icon_size="x2",
         )
         
-        if audio_bytes:
+        # The recorder returns the last recording on every rerun, a recording is only processed once
+        if audio_bytes and get_audio_hash(audio_bytes) != st.session_state["audio_hash"]:
+            st.session_state["audio_hash"] = get_audio_hash(audio_bytes)
             #st.audio(audio_bytes, format="audio/wav")
-            save_audio_file(audio_bytes)           
-
-            # Find the newest audio file
-            audio_file_path = os.path.join("..", project_folder_name, "data", "last-audio", "user_audio.mp3")
-            audio_transcription = transcribe_audio(audio_file_path)
-            user_voice = audio_transcription.text
 
-            messageforchat = f"Processing voice prompt ... 💫"
-            voice = True
-            get_response(LLM,user_voice, user_memory, history_chat_context, voice, messageforchat, tab_selected, selected_language)
+            # The recording goes from memory to the API, nothing is written to disk
+            try:
+                audio_transcription = get_service().run(user_id, asyncio.to_thread, transcribe_audio, audio_bytes).result()
+            except ServiceBusy:
+                audio_transcription = None
+                st.warning("The assistant is busy with other requests, please try again in a moment.")
+            except Exception as e:
+                audio_transcription = None
+                st.error(f"An error occurred during transcription: {e}")
+
+            if audio_transcription is not None:
+                user_voice = audio_transcription.text
+
+                messageforchat = f"Processing voice prompt ... 💫"
+                voice = True
+                get_response(user_voice, voice, messageforchat, tab_selected, selected_language)
         
         # We show the messages in the chat message component from streamlit
         for msg in st.session_state.messages2:
@@ -117,44 +142,86 @@ def main():
     if user_prompt := st.chat_input(placeholder="Ask anything about reminders, pending tasks, etc"):
         messageforchat = f"Processing user prompt ... 💫"
         voice = False
-        get_response(LLM, user_prompt, user_memory, history_chat_context, voice, messageforchat, tab_selected, selected_language)
+        get_response(user_prompt, voice, messageforchat, tab_selected, selected_language)
+
+@st.cache_resource
+def get_llm():
+    # One model object per process, its requests go through the shared connection pools.
+    # The chains run with astream and ainvoke on the service loop, so the async pool is the one in use.
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        temperature=0, 
+        model="gpt-4o-mini", 
+        openai_api_key=OPENAI_API_KEY, 
+        streaming=True,
+        http_client=get_http_client(),
+        http_async_client=get_http_async_client()
+    )
 
 def get_actual_date_and_time():
     now = datetime.now()
     return now.strftime("%d-%m-%Y %H:%M:%S")
 
-def update_user_memory(LLM, user_memory, history_chat_context):
+def add_greeting(user_id, user_memory, selected_language, tab_selected):
+    # Greetings are cached for every session, a templated one is shown until the personalized one is ready
+    greeting_cache = get_greeting_cache()
+    greeting_key = f"{tab_selected}_greeting"
+    if tab_selected not in st.session_state:
+        key = get_greeting_key(user_memory, selected_language)
+        greeting = greeting_cache.get(key)
+        if greeting is None:
+            greeting_cache.generate(key, lambda: start_message_chat(user_id, user_memory, selected_language))
+        st.session_state[tab_selected] = [{"role": "assistant", "content": greeting or get_fallback_greeting(selected_language)}]
+        st.session_state[greeting_key] = key if greeting is None else None
+    elif st.session_state.get(greeting_key) and len(st.session_state[tab_selected]) == 1:
+        # The personalized greeting replaces the templated one on a later rerun, as long as the user has not written yet
+        greeting = greeting_cache.get(st.session_state[greeting_key])
+        greeting_error = greeting_cache.get_error(st.session_state[greeting_key])
+        if greeting is not None:
+            st.session_state[tab_selected][0]["content"] = greeting
+            st.session_state[greeting_key] = None
+        elif greeting_error is not None:
+            # The templated greeting stays, the error is shown once and the next chat tries again
+            st.warning(f"The personalized greeting could not be generated: {greeting_error}")
+            st.session_state[greeting_key] = None
+
+@st.cache_resource
+def get_greeting_cache():
+    return GreetingCache()
+
+async def update_user_memory(user_memory, history_chat_context):
 
     current_datetime = get_actual_date_and_time()
 
+    # Only the operations are returned, a bad completion can not wipe the rest of the memory
+    return parse_operations(await get_update_memory_chain().ainvoke({"user_memory": user_memory, "current_datetime": current_datetime, "history_chat_context": history_chat_context}))
+
+@st.cache_resource
+def get_update_memory_chain():
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
     # Template and Chain
     UPDATEMEMORY = ChatPromptTemplate.from_messages(
         [
             (
                 "system",
                 """  
-                Based on the Actual User Memory provided below, please respond exclusively with the updated user memory. 
-                Ensure that your response adheres to the following format:
+                Based on the Actual User Memory provided below and the conversation that follows, respond exclusively with a JSON array
+                of the changes the user memory needs. Every item of the memory is shown with its id between brackets.
+                The allowed operations are:
                 -------------------------------------------
-                Format: 
-                - Last date modified: {current_datetime}
-                - User details:
-                    (List user details like name, age, etc, update or remove if necessary)
-                - Hobbies:
-                    (list Hobbies, update or remove if necessary)
-                - Reminders:
-                    (list reminders, date and time, update or remove if necessary)
-                - Pending tasks:
-                    (list pending tasks, update or remove if necessary)
-                - Gym schedule:
-                (...)
+                {{"op": "add", "section": "<details|hobbies|reminders|tasks|gym_schedule>", "content": "<new item>"}}
+                {{"op": "update", "id": <item id>, "content": "<new text of the item>"}}
+                {{"op": "delete", "id": <item id>}}
                 -------------------------------------------
-                If you determine that there is no need to update the user memory, please replicate the actual user memory in your response.
+                Reminders must include their date and time. Remove reminders and tasks that are expired or done.
+                If you determine that there is no need to update the user memory, respond with [].
                 Please find the following important parameters separated:
                 -------------------------------------------
-                Actual User Memory: <-{user_memory}->"
+                Current date and time: <-{current_datetime}->"
                 -------------------------------------------
-                Chat History: <-{history_chat_context}->"
+                Actual User Memory: <-{user_memory}->"
                 -------------------------------------------
                 """,
             ),
@@ -167,14 +234,14 @@ def update_user_memory(LLM, user_memory, history_chat_context):
          "current_datetime": itemgetter("current_datetime"),
          "history_chat_context": itemgetter("history_chat_context")}
         | UPDATEMEMORY 
-        | LLM 
+        | get_llm() 
         | StrOutputParser()
     )   
 
-    return interview_chain.invoke({"user_memory": user_memory, "current_datetime": current_datetime, "history_chat_context": history_chat_context})
+    return interview_chain
 
 
-def get_response(LLM, user_prompt, user_memory, history_chat_context, voice, messageforchat, tab_selected, selected_language):
+def get_response(user_prompt, voice, messageforchat, tab_selected, selected_language):
     # We add the user prompt to the messages and chat_history components and write it in chat_message component
     if(tab_selected == "messages1"):
         st.session_state.messages1.append({"role": "user", "content": user_prompt})
@@ -184,86 +251,217 @@ def get_response(LLM, user_prompt, user_memory, history_chat_context, voice, mes
     if (voice == False):
         st.chat_message("user").write(user_prompt)
 
-    history_chat_context += st.session_state[tab_selected]
+    user_id = st.session_state["user_id"]
+
+    # Every message once, older ones summarized, so the prompt does not grow with the length of the chat
+    chat_history = get_chat_history(tab_selected)
+    history_chat_context = chat_history.get_context(st.session_state[tab_selected])
 
     try:
-        with st.spinner(messageforchat):
-            response = user_memory_chain(LLM, user_prompt, user_memory, history_chat_context, selected_language)
-            # Add response to messages and chat_history components and write it in the chat_message component
-            if(tab_selected == "messages1"):
-                st.session_state.messages1.append({"role": "assistant", "content": response})
-            elif(tab_selected == "messages2"):
-                st.session_state.messages2.append({"role": "assistant", "content": response})
-            st.session_state.chat_history.append({"role": "assistant", "content": response})
-            if (voice == False):
-                st.chat_message("assistant").write(response)
-            history_chat_context += st.session_state[tab_selected]
-            updated_user_memory = update_user_memory(LLM, user_memory, history_chat_context)
-            save_user_memory_file(updated_user_memory)
+        # Only the memory sections related to the prompt are sent with it
+        relevant_memory = get_memory_store(user_id).render(get_relevant_sections(user_prompt))
+        response_stream, prompt_tokens = user_memory_chain(user_id, user_prompt, relevant_memory, history_chat_context, selected_language)
+        st.session_state.setdefault("prompt_tokens", []).append(prompt_tokens)
+        timings = {}
+        if (voice == False):
+            # The answer is written token by token in the chat_message component as the LLM streams it
+            with st.chat_message("assistant"):
+                response = st.write_stream(stream_with_timings(response_stream, timings))
+                st.caption(f"Prompt {prompt_tokens} tokens (history {count_message_tokens(history_chat_context)}) · "
+                           f"first token {timings['first_token']:.2f}s · total {timings['total']:.2f}s")
+        else:
+            # Every sentence is sent to text-to-speech as soon as the LLM has written it, and played in order
+            # while the next ones are synthesized
+            response_parts, tts_errors = [], []
+            status = st.empty()
+            status.info(messageforchat)
+            audio_placeholder = st.empty()
+
+            def play(audio_chunk):
+                status.empty()
+                audio_placeholder.audio(audio_chunk, format="audio/wav", autoplay=True)
+
+            # Every sentence is synthesized on the service so that it counts towards the request limits, next to the
+            # answer that is still streaming instead of behind it
+            client = get_openai_client(OPENAI_API_KEY)
+
+            def synthesize(sentence):
+                return get_service().run_alongside(user_id, asyncio.to_thread, synthesize_speech, client, sentence).result()
+
+            sentences = iter_sentences(collect_stream(stream_with_timings(response_stream, timings), response_parts))
+            audio_chunks = play_in_order(synthesize_in_order(sentences, synthesize, on_error=tts_errors.append), play)
+            status.empty()
+            response = "".join(response_parts)
+
+            # The whole answer stays available to be played again
+            if audio_chunks:
+                audio_placeholder.audio(join_wav(audio_chunks), format="audio/wav")
+            if tts_errors:
+                st.error(f"An error occurred during text-to-speech: {tts_errors[0]}")
+
+        # Stage timings and token counts of the answer
+        completion_tokens = count_tokens(response)
+        TELEMETRY.record("llm_first_token", timings["first_token"])
+        TELEMETRY.record("llm_total", timings["total"], prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        TELEMETRY.count("prompt_tokens", prompt_tokens)
+        TELEMETRY.count("completion_tokens", completion_tokens)
+
+        # Add response to messages and chat_history components
+        if(tab_selected == "messages1"):
+            st.session_state.messages1.append({"role": "assistant", "content": response})
+        elif(tab_selected == "messages2"):
+            st.session_state.messages2.append({"role": "assistant", "content": response})
+        st.session_state.chat_history.append({"role": "assistant", "content": response})
+
+        # The user memory is updated in the background, the next prompt does not wait for it
+        get_service().submit_latest(user_id, "memory", run_memory_update, user_id, chat_history.get_context(st.session_state[tab_selected]))
+    except ServiceBusy:
+        st.warning("The assistant is busy with other requests, please try again in a moment.")
     except Exception as e:
         st.error(f"An error occurred: {e}")
 
-    # Text-to-speech part
-    if voice == True:  # Only for chat input and in the chat tab
-        try:
-            # Create an API client
-            client = OpenAI(api_key=OPENAI_API_KEY)
-
-            # Generate audio from the assistant's response
-            response_audio = client.audio.speech.create(
-                model="tts-1",
-                voice="alloy", 
-                input=response
-            )
-
-            # Store the audio bytes in memory
-            audio_bytes = io.BytesIO(response_audio.content)
-            audio_bytes.seek(0)
-
-            # Play the audio in Streamlit
-            st.audio(audio_bytes, format="audio/mp3") 
-
-        except Exception as e:
-            st.error(f"An error occurred during text-to-speech: {e}")
+    # Once the answer is out, the messages that leave the history window are folded into the summary
+    try:
+        chat_history.compact(st.session_state[tab_selected], lambda summary, messages: summarize_chat_history(user_id, summary, messages))
+    except ServiceBusy:
+        # The history stays over its budget until the next answer compacts it
+        pass
+    except Exception as e:
+        st.error(f"An error occurred while summarizing the chat history: {e}")
+
+def stream_with_timings(stream, timings):
+    # Passes the chunks through and records the time to the first token and to the last one
+    start_time = time.perf_counter()
+    for chunk in stream:
+        if "first_token" not in timings:
+            timings["first_token"] = time.perf_counter() - start_time
+        yield chunk
+    timings.setdefault("first_token", time.perf_counter() - start_time)
+    timings["total"] = time.perf_counter() - start_time
+
+def collect_stream(stream, parts):
+    # Passes the chunks through and keeps them, the whole text is known once the stream is consumed
+    for chunk in stream:
+        parts.append(chunk)
+        yield chunk
+
+def synthesize_speech(client, text):
+    # Raw PCM has no container to wait for, it is wrapped in a WAV header to know how long it plays
+    with TELEMETRY.span("tts", chars=len(text)) as span:
+        response_audio = client.audio.speech.create(
+            model="tts-1",
+            voice="alloy", 
+            input=text,
+            response_format="pcm"
+        )
+        span["bytes"] = len(response_audio.content)
+    TELEMETRY.count("tts_chars", len(text))
+    TELEMETRY.count("tts_bytes", len(response_audio.content))
+    return pcm_to_wav(response_audio.content)
 
-def transcribe_audio(audio_file):
-    # Create an api client
-    client = OpenAI(api_key=OPENAI_API_KEY)
+def transcribe_audio(audio_bytes):
+    # Shared api client, the connection stays open between recordings
+    client = get_openai_client(OPENAI_API_KEY)
 
-    # Load audio file
-    audio_file= open(os.path.join(os.getcwd(), audio_file), "rb")
+    # The recorder gives WAV bytes, they are sent as an in memory file
+    if COMPRESS_AUDIO:
+        audio_bytes = compress_wav(audio_bytes)
 
     # Transcribe
-    transcription = client.audio.transcriptions.create(
-        model="whisper-1", 
-        file=audio_file
-    )
+    with TELEMETRY.span("stt", bytes=len(audio_bytes)) as span:
+        transcription = client.audio.transcriptions.create(
+            model="whisper-1", 
+            file=("user_audio.wav", audio_bytes, "audio/wav")
+        )
+        span["chars"] = len(transcription.text)
+    TELEMETRY.count("stt_bytes", len(audio_bytes))
 
     return transcription
 
-def save_user_memory_file(updated_user_memory):
-    directory = os.path.join("..", project_folder_name, "data", "user-memory")
+def read_user_memory_file():
+    with open(os.path.join("..", project_folder_name, "data", "user-memory", "user-memory.txt"), 'r') as doc:
+        return doc.read()
+
+def save_user_memory_file(directory, updated_user_memory):
     file_name = f"user-memory.txt"
     full_path = os.path.join(directory, file_name)
 
-    with open(full_path, "wb") as f:
-        f.write(updated_user_memory.encode('utf-8'))
+    # Atomic replace, a prompt reading the memory at the same time gets the old or the new file, never half of it
+    write_file_atomic(full_path, updated_user_memory)
 
     return file_name
 
-def save_audio_file(audio_bytes):
-    directory = os.path.join("..", project_folder_name, "data", "last-audio")
-    file_name = f"user_audio.mp3"
-    full_path = os.path.join(directory, file_name)
+def get_memory_store(user_id):
+
+    def import_legacy_memory(memory_store):
+        # The first time, the items of the old shared text memory are imported into the default user
+        if user_id == DEFAULT_USER and memory_store.is_empty() and os.path.exists(os.path.join("..", project_folder_name, "data", "user-memory", "user-memory.txt")):
+            memory_store.import_items(parse_legacy_memory(read_user_memory_file()))
+
+    return get_service().get_memory_store(user_id, on_create=import_legacy_memory)
+
+async def run_memory_update(user_id, history_chat_context):
+    # The memory is read when the update starts, so an update always applies to the result of the previous one.
+    # The SQLite store and the file are used in worker threads, the service loop keeps serving the other users.
+    memory_store = await asyncio.to_thread(get_memory_store, user_id)
+    user_prompts = [msg["content"] for msg in history_chat_context if msg["role"] == "user"]
+    sections = get_relevant_sections(user_prompts[-1]) if user_prompts else None
+    with TELEMETRY.span("memory_update", user=user_id) as span:
+        user_memory = await asyncio.to_thread(memory_store.render, sections)
+        operations = await update_user_memory(user_memory, history_chat_context)
+        applied = await asyncio.to_thread(memory_store.apply_operations, operations)
+        span.update(operations=len(operations), applied=applied)
+    if applied:
+        # Readable copy of the memory in the folder of the user, the store is the source of truth
+        await asyncio.to_thread(lambda: save_user_memory_file(get_service().get_user_dir(user_id), memory_store.render()))
+
+def get_chat_history(tab_selected):
+    # One history per chat tab, kept for the whole session
+    key = f"{tab_selected}_history"
+    if key not in st.session_state:
+        st.session_state[key] = ChatHistory()
+    return st.session_state[key]
+
+def summarize_chat_history(user_id, summary, messages):
+    # Runs on the service like every other model call, so it counts towards the request limits
+    return get_service().run(user_id, get_summary_chain().ainvoke, {"summary": summary, "messages": messages}).result()
+
+@st.cache_resource
+def get_summary_chain():
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
-    with open(full_path, "wb") as f:
-        f.write(audio_bytes)
+    # Template and Chain
+    SUMMARIZEHISTORY = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                """
+                Extend the summary of the conversation between the user and the personal assistant with the messages below.
+                Keep names, dates, times and decisions, and respond exclusively with the new summary in a few sentences.
+                -------------------------------------------
+                Current summary: <-{summary}->"
+                -------------------------------------------
+                """,
+            ),
+            MessagesPlaceholder(variable_name="messages"),
+        ]
+    )
 
-    return file_name
+    return SUMMARIZEHISTORY | get_llm() | StrOutputParser()
 
-def user_memory_chain(LLM, user_prompt, user_memory, history_chat_context, selected_language):
+def user_memory_chain(user_id, user_prompt, user_memory, history_chat_context, selected_language):
+    inputs = {"user_prompt": user_prompt, "user_memory": user_memory, "selected_language": selected_language, "history_chat_context": history_chat_context}
+    prompt_tokens = count_message_tokens(get_answer_prompt().format_messages(**inputs))
 
-    # Template and Chain
+    # Returns an iterator over the response text chunks as the service generates them, and the size of the prompt
+    return get_service().stream(user_id, get_answer_chain().astream, inputs), prompt_tokens
+
+@st.cache_resource
+def get_answer_prompt():
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+    # Template
     ANSWERPROMPT = ChatPromptTemplate.from_messages(
         [
             (
@@ -280,8 +478,6 @@ def user_memory_chain(LLM, user_prompt, user_memory, history_chat_context, selec
                 -------------------------------------------
                 User Memory: <-{user_memory}->"
                 -------------------------------------------
-                Chat History: <-{history_chat_context}->"
-                -------------------------------------------
                 Your response has to be in the following language: <-{selected_language}->"
                 -------------------------------------------
                 """,
@@ -290,19 +486,33 @@ def user_memory_chain(LLM, user_prompt, user_memory, history_chat_context, selec
         ]
     )
 
+    return ANSWERPROMPT
+
+@st.cache_resource
+def get_answer_chain():
+    from langchain_core.output_parsers import StrOutputParser
+
+    # Chain
     interview_chain = (
         {"user_memory": itemgetter("user_memory"),
          "user_prompt": itemgetter("user_prompt"),
          "selected_language": itemgetter("selected_language"),
          "history_chat_context": itemgetter("history_chat_context")}
-        | ANSWERPROMPT 
-        | LLM 
+        | get_answer_prompt() 
+        | get_llm() 
         | StrOutputParser()
     )   
 
-    return interview_chain.invoke({"user_prompt": user_prompt, "user_memory": user_memory, "selected_language": selected_language, "history_chat_context": history_chat_context})
+    return interview_chain
+
+def start_message_chat(user_id, user_memory, selected_language):
+    # Called from a greeting cache thread, the request itself runs on the service
+    return get_service().run(user_id, get_greeting_chain().ainvoke, {"user_memory": user_memory, "selected_language": selected_language}).result()
 
-def start_message_chat(LLM, user_memory, selected_language):
+@st.cache_resource
+def get_greeting_chain():
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate
 
     # Template and Chain
     FIRSTANSWER = ChatPromptTemplate.from_messages(
@@ -327,12 +537,14 @@ def start_message_chat(LLM, user_memory, selected_language):
         {"user_memory": itemgetter("user_memory"),
         "selected_language": itemgetter("selected_language")}
         | FIRSTANSWER 
-        | LLM 
+        | get_llm() 
         | StrOutputParser()
     )   
 
-    return interview_chain.invoke({"user_memory": user_memory, "selected_language": selected_language})
+    return interview_chain
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # The model work of the page runs on the service loop, it is profiled with the script
+    with profile_request(is_profiling(), PROFILES_DIR, "chat-assistant", get_service().loop):
+        main()
\ No newline at end of file
@@ -1,90 +1,350 @@
 import streamlit as st
 from dotenv import load_dotenv
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.chat_models import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationalRetrievalChain
 from pathlib import Path
-from PyPDF2 import PdfReader
-import docx
-import csv
-import io
-
-def create_vectorstore(uploaded_docs):
-    # Get PDF text
-    raw_text = get_raw_text(uploaded_docs)
-    #st.write(raw_text) # To print text in pdfs
-
-    # Get Text Chunks
-    text_chunks = get_text_chunks(raw_text)
-    #st.write(text_chunks) # To print the chunks
-
-    # Create Vector Store
-    embeddings = OpenAIEmbeddings() # Paid method
+import os
+import shutil
+import hashlib
+import itertools
+import tempfile
+import time
+import uuid
+from vector_index import INDEX_TYPES, resolve_index_type, get_index_type, count_document_vectors, add_document_vectors, build_vectorstore
+from resources import get_http_client, get_http_async_client, get_service
+from assistant_service import ServiceBusy
+from answer_cache import ANSWER_CACHE_SIMILARITY, AnswerCache, get_fingerprint
+from telemetry import TELEMETRY, profile_request
+from debug_panel import PROFILES_DIR, is_profiling, show_debug_panel
+from chat_history import count_tokens
+# LangChain, FAISS, the OpenAI SDK and the file parsers are imported by the functions that use them,
+# the page is drawn before any of them is loaded
+
+# Get the project name to use in path variables
+project_folder_name = os.path.basename(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))  # Three levels up
+
+# Chunking parameters in tokens, they are part of the index cache key
+CHUNK_TOKENS = 256
+CHUNK_OVERLAP_TOKENS = 32
+CHUNK_ENCODING = "cl100k_base"
+
+# Bumped whenever parsing or chunking changes the chunks of a file, so old cached indexes are not reused
+INDEX_FORMAT = 2
+
+# Chunks of a file are embedded and added to its index in batches of this size as its pages are parsed,
+# so the memory used while indexing does not grow with the size of the largest file
+INDEX_BATCH_CHUNKS = 256
+
+# Paragraphs first, then lines, then sentences, then words
+CHUNK_SEPARATORS = [r"\n\s*\n", r"\n", r"(?<=[.!?])\s+", r"\s+", ""]
+
+# Folder where the FAISS indexes are persisted, one sub folder per document key
+INDEX_CACHE_DIR = os.path.join("..", project_folder_name, "data", "vector-index")
+
+# Default number of chunks given to the LLM and weights of the dense and keyword rankings
+RETRIEVAL_K = 4
+VECTOR_WEIGHT = 0.5
+LEXICAL_WEIGHT = 0.5
+
+# FAISS index type of the session vectorstore, "auto" chooses it from the number of vectors
+INDEX_TYPE = "auto"
+
+# Folder with the columnar copy of every CSV file, used for exact-match and aggregate queries
+TABLE_CACHE_DIR = os.path.join("..", project_folder_name, "data", "csv-tables")
+
+# SQLite file with the chunk hash -> vector cache shared by every index
+EMBEDDING_CACHE_PATH = os.path.join("..", project_folder_name, "data", "embedding-cache", "embeddings.sqlite")
+
+@st.cache_resource
+def get_embeddings():
+    # One cached embedder per process, shared by every session
+    from langchain_openai import OpenAIEmbeddings
+    from embedding_cache import CachedEmbeddings
+    os.makedirs(os.path.dirname(EMBEDDING_CACHE_PATH), exist_ok=True)
+    embeddings = OpenAIEmbeddings(http_client=get_http_client(), http_async_client=get_http_async_client()) # Paid method
     #embeddings = HuggingFaceInstructEmbeddings(model_name="hkunlp/instructor-xl") # free
-    vectorstore = FAISS.from_texts(texts=text_chunks, embedding=embeddings)
-    return vectorstore
+    return CachedEmbeddings(embeddings, EMBEDDING_CACHE_PATH, namespace=embeddings.model)
+
+def get_document_key(doc):
+    # The key of an upload is computed once per session, big files are not hashed again on every rerun
+    document_keys = st.session_state.setdefault("document_keys", {})
+    file_id = getattr(doc, "file_id", None)
+    if file_id in document_keys:
+        return document_keys[file_id]
+
+    # Hash of the chunking parameters plus the type and contents of the file, the file name does not matter
+    hasher = hashlib.sha256(f"{INDEX_FORMAT}:{CHUNK_ENCODING}:{CHUNK_TOKENS}:{CHUNK_OVERLAP_TOKENS}:{Path(doc.name).suffix}".encode())
+    hasher.update(doc.getbuffer())
+    doc_key = hasher.hexdigest()
+    if file_id is not None:
+        document_keys[file_id] = doc_key
+    return doc_key
+
+def get_table_path(doc_key):
+    return os.path.join(TABLE_CACHE_DIR, f"{doc_key}.arrow")
 
-def get_raw_text(uploaded_docs):
+def get_index_path(doc_key):
+    return os.path.join(INDEX_CACHE_DIR, doc_key)
+
+def load_document_terms(doc_key, embeddings):
+    # Keyword statistics of a cached document index, computed from its chunks if they were not saved
+    from langchain.vectorstores import FAISS
+    from hybrid_retrieval import get_term_frequencies, load_term_frequencies
+    index_path = get_index_path(doc_key)
+    lexical_path = os.path.join(index_path, "lexical.json")
+    if os.path.isfile(lexical_path):
+        return load_term_frequencies(lexical_path)
+    doc_index = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+    return get_term_frequencies({chunk_id: doc_index.docstore.search(chunk_id).page_content for chunk_id in doc_index.index_to_docstore_id.values()})
+
+def build_document_index(doc, doc_key, chunk_batches, embeddings):
+    # Create the document Vector Store with one id per chunk and persist it, it is the cache of this file.
+    # The chunks are embedded batch by batch, returns the number of chunks, a file without any is not saved.
+    from langchain.vectorstores import FAISS
+    from hybrid_retrieval import get_term_frequencies, save_term_frequencies
+    index_path = get_index_path(doc_key)
+    doc_index, term_frequencies = None, {}
+    n_chunks, n_hits, embed_seconds = 0, 0, 0.0
+    for chunks in chunk_batches:
+        ids = [f"{doc_key}-{n_chunks + i}" for i in range(len(chunks))]
+        embed_start = time.perf_counter()
+        if doc_index is None:
+            doc_index = FAISS.from_documents(documents=chunks, embedding=embeddings, ids=ids)
+        else:
+            doc_index.add_documents(chunks, ids=ids)
+        embed_seconds += time.perf_counter() - embed_start
+        TELEMETRY.count("embedded_chunks", embeddings.last_stats["misses"])
+        TELEMETRY.count("embedding_cache_hits", embeddings.last_stats["hits"])
+        TELEMETRY.count("embedded_chars", sum(len(chunk.page_content) for chunk in chunks))
+        n_hits += embeddings.last_stats["hits"]
+        # The keyword statistics of the same chunks are computed in the same pass and saved next to the vectors
+        term_frequencies.update(get_term_frequencies({chunk_id: chunk.page_content for chunk_id, chunk in zip(ids, chunks)}))
+        n_chunks += len(chunks)
+    if doc_index is None:
+        return 0
+    TELEMETRY.record("embed", embed_seconds, document=doc.name, chunks=n_chunks, cache_hits=n_hits)
+
+    # The index is written to a temporary folder next to the cache folder and renamed, an index folder is only
+    # there once it is complete, so a run interrupted halfway does not leave a broken index behind as a cache hit
+    os.makedirs(INDEX_CACHE_DIR, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=INDEX_CACHE_DIR, prefix=".tmp-")
     try:
-        text = ""
-        for doc in uploaded_docs:
-            # Get file name and extension
-            file_path = Path(doc.name)
-
-            # If PDF then uses Pdf Reader
-            if(file_path.suffix == ".pdf"):
-                pdf_reader = PdfReader(doc)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + '\n'
-            
-            # if .txt then uses .read function
-            elif(file_path.suffix == ".txt"):
-                text += doc.read().decode() + '\n'
-
-            # if word file then uses python-docx library
-            elif(file_path.suffix == ".docx"):
-                word_doc = docx.Document(doc)
-                for para in word_doc.paragraphs:
-                    text += para.text + '\n'
-            
-            # if excel file then uses csv and io libraries
-            elif(file_path.suffix == ".csv"):
-                excel_doc = doc.read().decode("utf-8")
-                csv_reader = csv.reader(io.StringIO(excel_doc))
-                for row in csv_reader:
-                    text += ','.join(row) + '\n'
-            
-            text += "\n\n"
-            text += "###"
-            text += "\n\n"
-
-    except Exception as e:
-        st.error(f"Error reading the file: {e}")
-
-    return text
-
-def get_text_chunks(text):
-    text_splitter = RecursiveCharacterTextSplitter(
-        separators=["###"],
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
-    )
-    chunks = text_splitter.split_text(text)
-    return chunks
-
-def get_conversation_chain(vectorstore):
-    llm = ChatOpenAI(temperature=0)
-    memory = ConversationBufferMemory(memory_key='chat_history', return_messages=True)
-    conversation_chain = ConversationalRetrievalChain.from_llm(
-        llm=llm,
-        retriever=vectorstore.as_retriever(),
-        memory=memory
+        doc_index.save_local(tmp_path)
+        save_term_frequencies(os.path.join(tmp_path, "lexical.json"), term_frequencies)
+        try:
+            os.replace(tmp_path, index_path)
+        except OSError:
+            # Another session indexed the same file in the meantime, its index is kept
+            if not os.path.isdir(index_path):
+                raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    # Report how many chunks came from the embedding cache and how fast the file was embedded
+    st.caption(f"{doc.name}: {n_chunks} chunks, {n_hits / n_chunks:.0%} embedding cache hits, {n_chunks / max(embed_seconds, 1e-9):.0f} chunks/s")
+    return n_chunks
+
+def update_vectorstore(vectorstore, lexical_index, indexed_docs, uploaded_docs, index_type=INDEX_TYPE):
+    embeddings = get_embeddings()
+
+    # Identical files share the same key, so uploading a file twice is indexed once
+    current_docs = {get_document_key(doc): doc for doc in uploaded_docs}
+
+    # Delete only the vectors of the files removed from the uploader
+    removed_ids = []
+    for doc_key in [key for key in indexed_docs if key not in current_docs]:
+        removed_ids += indexed_docs.pop(doc_key)
+    if removed_ids:
+        lexical_index.remove(removed_ids)
+        # Flat indexes delete in place, the approximate ones are rebuilt below from the cached document indexes
+        if get_index_type(vectorstore.index) == "flat":
+            vectorstore.delete(removed_ids)
+        else:
+            vectorstore = None
+
+    # Files that are not cached yet are parsed and embedded, each one as soon as all its pages are chunked
+    new_docs = {doc_key: doc for doc_key, doc in current_docs.items() if doc_key not in indexed_docs and not os.path.isdir(get_index_path(doc_key))}
+    for doc_key in index_documents(new_docs, embeddings):
+        indexed_docs[doc_key] = []
+
+    # Cached files that are not in the vectorstore yet are added without embedding them again
+    added_keys = [doc_key for doc_key in current_docs if doc_key not in indexed_docs and os.path.isdir(get_index_path(doc_key))]
+    n_vectors = sum(len(ids) for ids in indexed_docs.values()) + sum(count_document_vectors(get_index_path(doc_key)) for doc_key in added_keys)
+
+    # The index is rebuilt when there is none yet or when the number of vectors asks for another index type
+    target_type = resolve_index_type(index_type, n_vectors)
+    if vectorstore is None or get_index_type(vectorstore.index) != target_type:
+        doc_keys = [doc_key for doc_key, ids in indexed_docs.items() if ids] + added_keys
+        # The rebuild reads the cached document indexes, another session may have cleared them since this one
+        # indexed its files. Those files are indexed again, and dropped if they cannot be read any more.
+        missing_docs = {doc_key: current_docs[doc_key] for doc_key in doc_keys if not os.path.isdir(get_index_path(doc_key))}
+        index_documents(missing_docs, embeddings)
+        for doc_key in [doc_key for doc_key in missing_docs if not os.path.isdir(get_index_path(doc_key))]:
+            doc_keys.remove(doc_key)
+            lexical_index.remove(indexed_docs.pop(doc_key, []))
+        vectorstore = build_vectorstore(embeddings, [get_index_path(doc_key) for doc_key in doc_keys], target_type)
+    else:
+        for doc_key in added_keys:
+            add_document_vectors(vectorstore, get_index_path(doc_key))
+
+    for doc_key in added_keys:
+        term_frequencies = load_document_terms(doc_key, embeddings)
+        indexed_docs[doc_key] = list(term_frequencies)
+        lexical_index.add(term_frequencies)
+
+    return vectorstore
+
+def index_documents(docs, embeddings):
+    # Parses, chunks and embeds the files into their cached indexes, returns the keys of the files without any text.
+    # Errors are shown per file, the index of a file that failed halfway is not saved.
+    empty_keys = []
+    for doc_key, chunk_batches in iter_document_chunks(docs):
+        try:
+            if not build_document_index(docs[doc_key], doc_key, chunk_batches, embeddings):
+                empty_keys.append(doc_key)
+        except Exception as e:
+            st.error(f"Error reading the file {docs[doc_key].name}: {e}")
+    return empty_keys
+
+def clear_index_cache():
+    shutil.rmtree(INDEX_CACHE_DIR, ignore_errors=True)
+    shutil.rmtree(TABLE_CACHE_DIR, ignore_errors=True)
+    get_embeddings().clear()
+
+def iter_document_chunks(docs):
+    # Yields (doc_key, chunk_batches) for every file in order. chunk_batches yields lists of at most INDEX_BATCH_CHUNKS
+    # chunks while the pages of the file are parsed, and raises the error of a file that could not be read at the end.
+    # It has to be consumed before the next file is taken.
+    if not docs:
+        return
+    from document_pipeline import iter_document_records
+    errors = {}
+
+    def on_error(doc_key, e):
+        errors[doc_key] = e
+
+    def iter_chunk_batches(doc_key, records):
+        # The parse time of a file is the time spent waiting for its records, not the time spent embedding them
+        doc, batch, n_chunks = docs[doc_key], [], 0
+        timings = {"parse": 0.0, "chunk": 0.0}
+        wait_start = time.perf_counter()
+        for _, location, text in records:
+            timings["parse"] += time.perf_counter() - wait_start
+            chunk_start = time.perf_counter()
+            chunks = get_text_chunks(text, {"source": doc.name, **location})
+            timings["chunk"] += time.perf_counter() - chunk_start
+            n_chunks += len(chunks)
+            batch += chunks
+            while len(batch) >= INDEX_BATCH_CHUNKS:
+                yield batch[:INDEX_BATCH_CHUNKS]
+                batch = batch[INDEX_BATCH_CHUNKS:]
+            wait_start = time.perf_counter()
+        # A file fails after the records of its pages read before the error
+        if doc_key in errors:
+            raise errors[doc_key]
+        if batch:
+            yield batch
+        record_document_timings(doc, n_chunks, timings)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # The worker processes read the uploads from disk, so the file bytes are not copied into every job
+        files = []
+        for doc_key, doc in docs.items():
+            path = os.path.join(tmp_dir, doc_key + Path(doc.name).suffix)
+            with open(path, "wb") as f:
+                f.write(doc.getbuffer())
+            files.append((doc_key, path))
+
+        # Records arrive page by page in document order, they are chunked right away
+        seen = set()
+        records = iter_document_records(files, on_error=on_error, tables_dir=TABLE_CACHE_DIR)
+        for doc_key, doc_records in itertools.groupby(records, key=lambda record: record[0]):
+            seen.add(doc_key)
+            yield doc_key, iter_chunk_batches(doc_key, doc_records)
+
+    # Files without any text or that failed before their first page are reported too, so files without text
+    # are not parsed again on every prompt
+    for doc_key in docs:
+        if doc_key not in seen:
+            yield doc_key, iter_chunk_batches(doc_key, [])
+
+def record_document_timings(doc, n_chunks, timings):
+    TELEMETRY.record("parse", timings["parse"], document=doc.name, bytes=doc.size)
+    TELEMETRY.record("chunk", timings["chunk"], document=doc.name, chunks=n_chunks)
+    TELEMETRY.count("parsed_bytes", doc.size)
+    TELEMETRY.count("chunks", n_chunks)
+
+@st.cache_resource
+def get_text_splitter():
+    # Splits on paragraphs, then sentences, and measures chunks in model tokens instead of characters
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name=CHUNK_ENCODING,
+        separators=CHUNK_SEPARATORS,
+        is_separator_regex=True,
+        chunk_size=CHUNK_TOKENS,
+        chunk_overlap=CHUNK_OVERLAP_TOKENS
     )
-    return conversation_chain
+
+def get_text_chunks(text, metadata):
+    # Every chunk keeps the source file and the page or rows it comes from
+    return get_text_splitter().create_documents([text], metadatas=[metadata])
+
+@st.cache_resource
+def get_answer_cache():
+    # Shared by every session, answers are only reused for the same documents and retrieval settings
+    return AnswerCache()
+
+def show_answer_cache_settings():
+    answer_cache = get_answer_cache()
+    with st.expander("Answer cache"):
+        use_answer_cache = st.checkbox("Reuse answers to repeated questions", value=True)
+        similarity = st.slider("Question similarity", 0.80, 1.0, ANSWER_CACHE_SIMILARITY, 0.01, help="1 only reuses answers to the same question text, below 1 the names and numbers still have to match")
+        metrics = answer_cache.get_metrics()
+        st.caption(f"{metrics['entries']} answers · {metrics['hits']} hits · {metrics['similar_hits']} similar hits · "
+                   f"{metrics['misses']} misses · hit rate {metrics['hit_rate']:.0%}")
+    return use_answer_cache, similarity
+
+def get_sources(source_documents):
+    # Unique "file (page/rows)" labels of the chunks used to answer, in retrieval order
+    sources = []
+    for document in source_documents:
+        metadata = document.metadata
+        source = metadata.get("source", "")
+        if "page" in metadata:
+            source += f" (p. {metadata['page']})"
+        elif "row_start" in metadata:
+            source += f" (rows {metadata['row_start']}-{metadata['row_end']})"
+        if source and source not in sources:
+            sources.append(source)
+    return sources
+
+def show_csv_lookup(uploaded_docs):
+    # Exact-match and aggregate questions over CSV files are answered from the columnar tables, without embeddings
+    from csv_tables import AGGREGATE_OPERATIONS, get_table_columns, find_rows, aggregate_column
+    csv_tables = {}
+    for doc in uploaded_docs or []:
+        if Path(doc.name).suffix == ".csv":
+            table_path = get_table_path(get_document_key(doc))
+            if os.path.isfile(table_path):
+                csv_tables[doc.name] = table_path
+    if not csv_tables:
+        return
+
+    st.subheader("CSV lookup")
+    table_path = csv_tables[st.selectbox("File", list(csv_tables))]
+    column = st.selectbox("Column", get_table_columns(table_path))
+    operation = st.selectbox("Operation", ["equals"] + AGGREGATE_OPERATIONS)
+    value = st.text_input("Value") if operation == "equals" else ""
+
+    if st.button("Run lookup"):
+        try:
+            if operation == "equals":
+                rows, total = find_rows(table_path, column, value)
+                st.caption(f"{total} matching rows")
+                st.dataframe(rows.to_pandas())
+            else:
+                st.metric(f"{operation} of {column}", aggregate_column(table_path, column, operation))
+        except Exception as e:
+            st.error(f"Error running the lookup: {e}")
 
 def main():
 
@@ -100,10 +360,48 @@ def main():
         st.session_state.conversation = None
     if "chat_history" not in st.session_state:
         st.session_state["chat_history"] = []
+    # (question, answer) turns the follow-up questions are rewritten with, cached answers included
+    if "chat_turns" not in st.session_state:
+        st.session_state.chat_turns = []
+    if "vectorstore" not in st.session_state:
+        st.session_state.vectorstore = None
+    if "indexed_docs" not in st.session_state:
+        st.session_state.indexed_docs = {}
+    # Created with the first index, hybrid_retrieval loads LangChain
+    if "lexical_index" not in st.session_state:
+        st.session_state.lexical_index = None
+    # The questions of a session are queued on the service one after the other
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+
+    with st.sidebar:
+        # Number of chunks and weight of the keyword ranking used by the hybrid retriever
+        with st.expander("Retrieval settings"):
+            retrieval_k = st.slider("Chunks per answer", 1, 20, RETRIEVAL_K)
+            lexical_weight = st.slider("Keyword weight", 0.0, 1.0, LEXICAL_WEIGHT / (VECTOR_WEIGHT + LEXICAL_WEIGHT))
+            index_type = st.selectbox("Index type", INDEX_TYPES, index=INDEX_TYPES.index(INDEX_TYPE))
+
+        # Removes every persisted index and forces the next prompt to rebuild the conversation chain
+        if st.button("Clear cache"):
+            clear_index_cache()
+            st.session_state.conversation = None
+            st.session_state.vectorstore = None
+            st.session_state.indexed_docs = {}
+            st.session_state.lexical_index = None
+            get_answer_cache().clear()
+            st.success("Index cache cleared.")
+
+        use_answer_cache, similarity = show_answer_cache_settings()
+
+    show_debug_panel()
 
     # We add the file uploader component from streamlit to accept multiple files
     uploaded_docs = st.file_uploader("Upload your files: .pdf, .txt, .docx, .csv", accept_multiple_files=True)    
 
+    # CSV files that were already indexed can be queried directly
+    with st.sidebar:
+        show_csv_lookup(uploaded_docs)
+
     # If there are no messages in the chat then we add the assistant message
     if "messages" not in st.session_state:
         st.session_state["messages"] = [{"role": "assistant", "content": "Hello, how can I help you?"}]
@@ -120,32 +418,105 @@ def main():
         st.session_state.chat_history.append({"role": "user", "content": prompt})
         st.chat_message("user").write(prompt)
 
+        start_time = time.perf_counter()
+        question = """
+                Answer the question based only on the following context:
+                You are a human resource assistant. Your job is to respond to the user's prompt:
+                """ + prompt
+        # A follow-up like "and Alice?" depends on the earlier turns. It is rewritten into a standalone question first,
+        # like the chain would do, and that question is looked up in the cache and sent to the chain.
+        # Without history the prompt is already standalone.
+        chat_turns = st.session_state.chat_turns
+        cache_question = prompt
+        if chat_turns:
+            from conversation_chain import condense_question
+            try:
+                question = cache_question = get_service().run(st.session_state.session_id, condense_question, question, chat_turns).result()
+            except ServiceBusy:
+                st.warning("The assistant is busy with other requests, please try again in a moment.")
+                return
+
+        # The same question about the same documents and settings is answered from the cache, without retrieval or LLM
+        answer_cache = get_answer_cache()
+        fingerprint = get_fingerprint([get_document_key(doc) for doc in uploaded_docs], INDEX_FORMAT, retrieval_k, lexical_weight, index_type)
+        embed = get_embeddings().embed_query if similarity < 1 else None
+        cached = answer_cache.get(fingerprint, cache_question, embed, similarity) if use_answer_cache else None
+        if cached is not None:
+            content = cached["content"] + "\n\n*Cached answer*"
+            st.session_state.messages.append({"role": "assistant", "content": content})
+            st.session_state.chat_history.append({"role": "assistant", "content": cached["answer"]})
+            with st.chat_message("assistant"):
+                st.markdown(content)
+                st.caption(f"Cached answer · {(time.perf_counter() - start_time) * 1000:.0f} ms")
+            TELEMETRY.record("answer_cache_hit", time.perf_counter() - start_time)
+            # Follow-up questions still see this exchange
+            chat_turns.append((prompt, cached["answer"]))
+            return
+
         with st.spinner("Processing"):
+            from hybrid_retrieval import LexicalIndex
+            from conversation_chain import StreamHandler, get_conversation_chain, stream_answer
+            if st.session_state.lexical_index is None:
+                st.session_state.lexical_index = LexicalIndex()
+
+            # Update the vectorstore with the added and removed files only
+            vectorstore = update_vectorstore(st.session_state.vectorstore, st.session_state.lexical_index, st.session_state.indexed_docs, uploaded_docs, index_type)
+            if vectorstore is None:
+                st.error("No text could be extracted from the uploaded files.")
+                return
+
+            # The chain keeps a reference to the vectorstore, so it is only created when the vectorstore is new
+            if st.session_state.conversation is None or vectorstore is not st.session_state.vectorstore:
+                st.session_state.conversation = get_conversation_chain(vectorstore, st.session_state.lexical_index, retrieval_k, 1 - lexical_weight, lexical_weight)
+                st.session_state.vectorstore = vectorstore
+            retriever = st.session_state.conversation.retriever
+            retriever.k = retrieval_k
+            retriever.vector_weight = 1 - lexical_weight
+            retriever.lexical_weight = lexical_weight
+
+        # Send prompt and stream the response from llm token by token in the chat_message component
+        with st.chat_message("assistant"):
+            placeholder = st.empty()
+            stream_handler = StreamHandler(placeholder)
+            # The chain runs on the service, the tokens it streams are written here
+            result = {}
+            try:
+                for token in get_service().stream(st.session_state.session_id, stream_answer, st.session_state.conversation, question, result):
+                    stream_handler.on_llm_new_token(token)
+            except ServiceBusy:
+                placeholder.warning("The assistant is busy with other requests, please try again in a moment.")
+                return
+            response = result['response']
+            total_time = time.perf_counter() - stream_handler.start_time
 
-            # Create vectorstore
-            vectorstore = create_vectorstore(uploaded_docs)
-
-            # Cretate conversation chain
-            st.session_state.conversation = get_conversation_chain(vectorstore)
-        
-            # Send prompt and get response from llm
-            response = st.session_state.conversation({
-                'question': 
-                    """
-                    Answer the question based only on the following context:
-                    You are a human resource assistant. Your job is to respond to the user's prompt:
-                    """ + prompt
-            })
-            
             # st.write(response) # debug command to print question or prompt, chat history and answer
             msg = response['answer']
 
-            # Add response to messages and chat_history components and write it in the chat_message component
-            st.session_state.messages.append({"role": "assistant", "content": msg})
+            # Add response to messages and chat_history components and write the final answer with its sources
+            sources = get_sources(response['source_documents'])
+            content = msg + (f"\n\n*Sources: {', '.join(sources)}*" if sources else "")
+            st.session_state.messages.append({"role": "assistant", "content": content})
             st.session_state.chat_history.append({"role": "assistant", "content": msg})
-            st.chat_message("assistant").write(msg)
+            chat_turns.append((prompt, msg))
+            placeholder.markdown(content)
+            first_token = stream_handler.first_token if stream_handler.first_token is not None else total_time
+            st.caption(f"First token {first_token:.2f}s · total {total_time:.2f}s")
+            TELEMETRY.record("llm_first_token", first_token)
+            completion_tokens = count_tokens(msg)
+            TELEMETRY.record("llm_total", total_time, completion_tokens=completion_tokens)
+            TELEMETRY.count("completion_tokens", completion_tokens)
+
+        # Cached under the standalone question, a follow-up like "and Alice?" is never stored as it was typed
+        if use_answer_cache:
+            answer = {"answer": msg, "content": content}
+            try:
+                answer_cache.put(fingerprint, cache_question, answer, embed)
+            except Exception as e:
+                st.warning(f"The answer could not be cached: {e}")
 
 
 # Initializing application by executing main function
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # The model work of the page runs on the service loop, it is profiled with the script
+    with profile_request(is_profiling(), PROFILES_DIR, "multiple-files", get_service().loop):
+        main()
\ No newline at end of file
@@ -0,0 +1,107 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Answers kept in memory, the least recently used one is dropped first
+ANSWER_CACHE_SIZE = 1000
+# Documents do not change under a fingerprint, but the answers should not live forever
+ANSWER_CACHE_TTL_SECONDS = 24 * 60 * 60
+# Cosine similarity from which a different wording counts as the same question, 1 only accepts equal normalized questions.
+# Questions about different people are very similar too, so similar questions are opt-in.
+ANSWER_CACHE_SIMILARITY = 1.0
+
+def get_fingerprint(document_keys, *settings):
+    # The documents and the retrieval settings an answer depends on
+    return hashlib.sha256(repr((sorted(document_keys), settings)).encode('utf-8')).hexdigest()
+
+def normalize_question(question):
+    # "What skills does Bob have?" and "what skills does bob have" are the same question
+    return " ".join(re.findall(r"\w+", question.lower()))
+
+def get_key_terms(question):
+    # Names and numbers of a question, "What skills does Bob have?" and "What skills does Alice have?" only differ here.
+    # The first word of a sentence is capitalized anyway, so it does not count as a name.
+    terms = set()
+    for sentence in re.split(r"[.?!]+", question):
+        words = re.findall(r"\w+", sentence)
+        terms.update(word.lower() for word in words[1:] if word[0].isupper())
+        terms.update(word for word in words if any(char.isdigit() for char in word))
+    return frozenset(terms)
+
+class AnswerCache:
+    # Thread safe cache of answers per document set fingerprint. A question is found by its normalized text,
+    # or, when an embedder is given, by the most similar cached question of the same fingerprint with the same names
+    # and numbers.
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, ttl_seconds=ANSWER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stats = {"hits": 0, "similar_hits": 0, "misses": 0, "evictions": 0}
+        # (fingerprint, normalized question) -> (created, question vector or None, key terms, answer)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint, question, embed=None, similarity=ANSWER_CACHE_SIMILARITY):
+        key = (fingerprint, normalize_question(question))
+        with self._lock:
+            self._expire()
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._entries[key][3]
+            terms = get_key_terms(question)
+            candidates = [
+                (entry_key, vector) for entry_key, (_, vector, entry_terms, _) in self._entries.items()
+                if entry_key[0] == fingerprint and vector is not None and entry_terms == terms
+            ]
+        if embed is not None and similarity < 1 and candidates:
+            # Embedded outside the lock, the vectors are normalized so the dot product is the cosine similarity
+            import numpy as np
+            vector = self._normalize(embed(question))
+            scores = np.stack([candidate for _, candidate in candidates]) @ vector
+            best = int(np.argmax(scores))
+            with self._lock:
+                entry_key = candidates[best][0]
+                if scores[best] >= similarity and entry_key in self._entries:
+                    self._entries.move_to_end(entry_key)
+                    self.stats["similar_hits"] += 1
+                    return self._entries[entry_key][3]
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, fingerprint, question, answer, embed=None):
+        vector = self._normalize(embed(question)) if embed is not None else None
+        with self._lock:
+            key = (fingerprint, normalize_question(question))
+            self._entries[key] = (time.monotonic(), vector, get_key_terms(question), answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def get_metrics(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["similar_hits"] + self.stats["misses"]
+            hit_rate = (self.stats["hits"] + self.stats["similar_hits"]) / lookups if lookups else 0.0
+            return dict(self.stats, entries=len(self._entries), hit_rate=hit_rate)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _expire(self):
+        # Entries are in use order, not creation order, so every entry is checked
+        now = time.monotonic()
+        for key in [key for key, (created, _, _, _) in self._entries.items() if now - created > self.ttl_seconds]:
+            del self._entries[key]
+            self.stats["evictions"] += 1
+
+    @staticmethod
+    def _normalize(vector):
+        # numpy is only loaded once questions are compared by similarity
+        import numpy as np
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
@@ -0,0 +1,156 @@
+import asyncio
+import contextlib
+import hashlib
+import os
+import queue
+import re
+import threading
+import traceback
+from memory_store import MemoryStore
+
+# Model requests running at the same time for all users together
+MAX_CONCURRENT_REQUESTS = 8
+# Requests waiting or running, above this new ones are rejected instead of queued
+MAX_PENDING_REQUESTS = 64
+
+class ServiceBusy(Exception):
+    pass
+
+def get_user_namespace(user_id):
+    # Folder name of a user: readable part plus a hash, so "a/b" and "a_b" do not share a memory
+    slug = re.sub(r"[^\w.-]", "_", user_id)[:40]
+    return f"{slug}-{hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:8]}"
+
+class AssistantService:
+    # Runs the model work of every session on one asyncio loop in a background thread. The requests of a user are
+    # queued and run one at a time in order, all users together share a bounded number of concurrent requests.
+    # Streamlit pages submit work and read the results, they never wait on each other.
+
+    def __init__(self, memory_dir, max_concurrency=MAX_CONCURRENT_REQUESTS, max_pending=MAX_PENDING_REQUESTS):
+        self.memory_dir = memory_dir
+        self.max_pending = max_pending
+        self.stats = {"completed": 0, "failed": 0, "rejected": 0, "pending": 0, "in_flight": 0, "max_in_flight": 0}
+        self._stats_lock = threading.Lock()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Only used from the loop thread
+        self._locks = {}
+        self._jobs_running = set()
+        self._jobs_pending = {}
+        self._job_errors = {}
+        self._stores = {}
+        self._stores_lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="assistant-service", daemon=True).start()
+
+    def get_user_dir(self, user_id):
+        user_dir = os.path.join(self.memory_dir, get_user_namespace(user_id))
+        os.makedirs(user_dir, exist_ok=True)
+        return user_dir
+
+    def get_memory_store(self, user_id, on_create=None):
+        # One store per user, on_create(store) runs when it is opened for the first time in this process
+        with self._stores_lock:
+            if user_id not in self._stores:
+                store = MemoryStore(os.path.join(self.get_user_dir(user_id), "user-memory.sqlite"))
+                if on_create is not None:
+                    on_create(store)
+                self._stores[user_id] = store
+            return self._stores[user_id]
+
+    def run(self, user_id, coroutine_function, *args):
+        # Queues coroutine_function(*args) behind the previous requests of the user, returns a concurrent Future
+        self._reserve()
+        return asyncio.run_coroutine_threadsafe(self._run_request((user_id, "requests"), coroutine_function, args), self.loop)
+
+    def run_alongside(self, user_id, coroutine_function, *args):
+        # Like run, for work that belongs to a running request of the user, e.g. the speech of an answer that is
+        # still being written. It is not queued behind that request, only counted in the limits of all users.
+        self._reserve()
+        return asyncio.run_coroutine_threadsafe(self._run_request(None, coroutine_function, args), self.loop)
+
+    def stream(self, user_id, generator_function, *args):
+        # Like run, for an async generator: yields its chunks in the calling thread as they are produced
+        chunks, done = queue.Queue(), object()
+
+        async def produce():
+            async for chunk in generator_function(*args):
+                chunks.put(chunk)
+
+        future = self.run(user_id, produce)
+        future.add_done_callback(lambda _: chunks.put(done))
+        try:
+            while (chunk := chunks.get()) is not done:
+                yield chunk
+            future.result()
+        finally:
+            # A reader that stops early (e.g. a rerun) cancels the request
+            future.cancel()
+
+    def submit_latest(self, user_id, name, coroutine_function, *args):
+        # Background job of a user: while one runs, a newer submission replaces the waiting one,
+        # so a burst of turns ends up in a single run with the latest arguments
+        self.loop.call_soon_threadsafe(self._schedule_latest, (user_id, name), coroutine_function, args)
+
+    def get_job_error(self, user_id, name):
+        return self._job_errors.get((user_id, name))
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def _reserve(self):
+        with self._stats_lock:
+            if self.stats["pending"] >= self.max_pending:
+                self.stats["rejected"] += 1
+                raise ServiceBusy(f"{self.stats['pending']} requests are already waiting")
+            self.stats["pending"] += 1
+
+    def _count(self, **changes):
+        with self._stats_lock:
+            for key, change in changes.items():
+                self.stats[key] += change
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+
+    async def _run_request(self, lock_key, coroutine_function, args):
+        try:
+            result = await self._limited(lock_key, coroutine_function, args)
+            self._count(completed=1)
+            return result
+        except Exception:
+            self._count(failed=1)
+            raise
+        finally:
+            self._count(pending=-1)
+
+    async def _limited(self, lock_key, coroutine_function, args):
+        # asyncio locks are fair, so the requests of a user run in the order they were submitted.
+        # Without a lock key the request only waits for the global limit.
+        lock = self._locks.setdefault(lock_key, asyncio.Lock()) if lock_key is not None else contextlib.nullcontext()
+        async with lock, self._semaphore:
+            self._count(in_flight=1)
+            try:
+                return await coroutine_function(*args)
+            finally:
+                self._count(in_flight=-1)
+
+    def _schedule_latest(self, key, coroutine_function, args):
+        if key in self._jobs_running:
+            self._jobs_pending[key] = (coroutine_function, args)
+            return
+        self._jobs_running.add(key)
+        self.loop.create_task(self._run_latest(key, coroutine_function, args))
+
+    async def _run_latest(self, key, coroutine_function, args):
+        try:
+            while True:
+                try:
+                    await self._limited(key, coroutine_function, args)
+                    self._job_errors.pop(key, None)
+                except Exception as e:
+                    self._job_errors[key] = e
+                    traceback.print_exc()
+                if key not in self._jobs_pending:
+                    break
+                coroutine_function, args = self._jobs_pending.pop(key)
+        finally:
+            self._jobs_running.discard(key)
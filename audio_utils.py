@@ -0,0 +1,44 @@
+import hashlib
+import io
+import wave
+
+# Whisper works on 16 kHz mono audio, anything above only makes the upload bigger
+TRANSCRIPTION_SAMPLE_RATE = 16_000
+
+def get_audio_hash(audio_bytes):
+    return hashlib.sha256(audio_bytes).hexdigest()
+
+def compress_wav(audio_bytes, sample_rate=TRANSCRIPTION_SAMPLE_RATE):
+    # Downmixes to mono 16-bit and resamples to sample_rate. The original bytes are returned
+    # if they are not a PCM WAV file or if the result would not be smaller.
+    try:
+        with wave.open(io.BytesIO(audio_bytes), "rb") as wav:
+            channels, sample_width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return audio_bytes
+    if sample_width not in (1, 2, 4):
+        return audio_bytes
+
+    # 8-bit WAV is unsigned, 16 and 32-bit are signed. numpy is loaded with the first recording.
+    import numpy as np
+    if sample_width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    else:
+        dtype = np.int16 if sample_width == 2 else np.int32
+        samples = np.frombuffer(frames, dtype=dtype).astype(np.float32) / np.iinfo(dtype).max
+    samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+
+    if rate > sample_rate and len(samples):
+        positions = np.arange(0, len(samples), rate / sample_rate)
+        samples = np.interp(positions, np.arange(len(samples)), samples)
+        rate = sample_rate
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+    compressed = buffer.getvalue()
+    return compressed if len(compressed) < len(audio_bytes) else audio_bytes
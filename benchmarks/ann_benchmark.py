@@ -0,0 +1,63 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+# The benchmarks are run as scripts, so the project root is added to the import path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import MAX_TRAIN_VECTORS, create_index, get_factory_string, get_index_memory
+
+def make_vectors(n_vectors, n_queries, dim, seed):
+    # Gaussian clusters, closer to real embeddings than uniform noise, normalized like OpenAI embeddings
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n_vectors // 1000), dim)).astype(np.float32)
+
+    def sample(n):
+        points = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+        return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+    return sample(n_vectors), sample(n_queries)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build time, query latency, memory and recall of the FAISS index types used by the app.")
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--types", default="flat,hnsw,ivf,ivfpq")
+    args = parser.parse_args()
+
+    vectors, queries = make_vectors(args.vectors, args.queries, args.dim, args.seed)
+    print(f"{args.vectors} vectors, {args.queries} queries, dim {args.dim}, recall@{args.k} against flat")
+    print(f"{'type':<7}{'factory':<18}{'build s':>9}{'p50 ms':>9}{'p99 ms':>9}{'memory MB':>11}{'recall':>8}")
+
+    exact_ids = None
+    for index_type in ["flat"] + [t for t in args.types.split(",") if t != "flat"]:
+        start_time = time.perf_counter()
+        index = create_index(index_type, args.dim, args.vectors)
+        if not index.is_trained:
+            index.train(vectors[:MAX_TRAIN_VECTORS])
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start_time
+
+        # One query at a time, like the app does for every question
+        latencies, ids = [], []
+        for query in queries:
+            start_time = time.perf_counter()
+            _, found = index.search(query[None, :], args.k)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+            ids.append(found[0])
+        ids = np.array(ids)
+        if exact_ids is None:
+            exact_ids = ids
+        recall = np.mean([len(set(found) & set(exact)) / args.k for found, exact in zip(ids, exact_ids)])
+
+        print(f"{index_type:<7}{get_factory_string(index_type, args.dim, args.vectors):<18}{build_seconds:>9.2f}"
+              f"{np.percentile(latencies, 50):>9.3f}{np.percentile(latencies, 99):>9.3f}"
+              f"{get_index_memory(index) / 1e6:>11.1f}{recall:>8.3f}")
+
+if __name__ == '__main__':
+    main()
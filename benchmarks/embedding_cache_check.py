@@ -0,0 +1,81 @@
+import os
+import sys
+import tempfile
+import threading
+import httpx
+import openai
+
+# The benchmarks are run as scripts, so the project root is added to the import path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_cache import CachedEmbeddings
+from fakes import HashingEmbeddings
+
+class CountingEmbeddings(HashingEmbeddings):
+    # Counts the texts sent to the model and fails the first calls with the given errors
+
+    def __init__(self, errors=()):
+        super().__init__()
+        self.errors = list(errors)
+        self.calls = 0
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        self.texts += texts
+        return super().embed_documents(texts)
+
+def api_error(error_class, status_code):
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    return error_class("error", response=httpx.Response(status_code, request=request), body=None)
+
+def check(condition, message):
+    if not condition:
+        sys.exit(f"FAILED: {message}")
+    print(f"ok: {message}")
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "embeddings.sqlite")
+        model = CountingEmbeddings()
+        embeddings = CachedEmbeddings(model, db_path, namespace="hashing", batch_size=2, backoff_seconds=0)
+
+        texts = ["alpha", "beta", "alpha", "gamma"]
+        vectors = embeddings.embed_documents(texts)
+        check(sorted(model.texts) == ["alpha", "beta", "gamma"], "a repeated text is embedded once")
+        check(vectors[0] == vectors[2], "repeated texts get the same vector")
+        check(embeddings.last_stats["misses"] == 4 and embeddings.last_stats["hits"] == 0, "first call counts every chunk as a miss")
+
+        model.texts = []
+        check(embeddings.embed_documents(["gamma", "alpha", "delta"])[:2] == [vectors[3], vectors[0]], "cached vectors are returned unchanged")
+        check(model.texts == ["delta"], "only the new text is embedded")
+        check(embeddings.last_stats["hits"] == 2 and embeddings.last_stats["misses"] == 1, "hits and misses are counted per chunk")
+
+        # Sessions embed in their own threads, a call of another thread does not change the stats of this one
+        thread = threading.Thread(target=embeddings.embed_documents, args=(["epsilon", "zeta"],))
+        thread.start()
+        thread.join()
+        check(embeddings.last_stats["chunks"] == 3, "the stats of the last call are kept per thread")
+
+        # The cache is persistent and keeps the vectors of another namespace apart
+        model.texts = []
+        CachedEmbeddings(model, db_path, namespace="hashing").embed_documents(["alpha"])
+        check(model.texts == [], "vectors survive a new wrapper on the same file")
+        CachedEmbeddings(model, db_path, namespace="other").embed_documents(["alpha"])
+        check(model.texts == ["alpha"], "another namespace does not share vectors")
+
+        # Rate limits and server errors are retried, a bad request is raised at once
+        flaky = CountingEmbeddings([api_error(openai.RateLimitError, 429), api_error(openai.InternalServerError, 500)])
+        CachedEmbeddings(flaky, os.path.join(tmp_dir, "flaky.sqlite"), backoff_seconds=0).embed_documents(["alpha"])
+        check(flaky.calls == 3, "transient errors are retried")
+        broken = CountingEmbeddings([api_error(openai.BadRequestError, 400)])
+        try:
+            CachedEmbeddings(broken, os.path.join(tmp_dir, "broken.sqlite"), backoff_seconds=0).embed_documents(["alpha"])
+        except openai.BadRequestError:
+            pass
+        check(broken.calls == 1, "other errors are not retried")
+
+if __name__ == '__main__':
+    main()
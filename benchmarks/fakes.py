@@ -0,0 +1,61 @@
+import hashlib
+import io
+import math
+import re
+import struct
+import time
+import wave
+from langchain_core.embeddings import Embeddings
+
+class HashingEmbeddings(Embeddings):
+    # Deterministic local stand-in for OpenAIEmbeddings: hashed word and character trigram counts,
+    # normalized. Similar texts get similar vectors, so retrieval quality can be measured offline.
+
+    def __init__(self, size=256):
+        self.size = size
+
+    def _embed(self, text):
+        vector = [0.0] * self.size
+        for word in re.findall(r"\w+", text.lower()):
+            for feature in [word] + [word[i:i + 3] for i in range(max(len(word) - 2, 0))]:
+                digest = hashlib.md5(feature.encode("utf-8")).digest()
+                index = int.from_bytes(digest[:4], "little") % self.size
+                vector[index] += 1.0 if digest[4] % 2 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+def fake_token_stream(text, tokens_per_second=50.0, first_token_seconds=0.3):
+    # Local stand-in for a streaming chat model: yields the words of text at a steady rate
+    time.sleep(first_token_seconds)
+    for i, word in enumerate(re.findall(r"\S+\s*", text)):
+        if i:
+            time.sleep(1.0 / tokens_per_second)
+        yield word
+
+class FakeSpeech:
+    # Local stand-in for the OpenAI speech endpoint: waits like a request would and returns a WAV tone
+    # as long as the text would take to read
+
+    def __init__(self, base_seconds=0.4, seconds_per_char=0.004, chars_per_second=15.0, sample_rate=24_000):
+        self.base_seconds = base_seconds
+        self.seconds_per_char = seconds_per_char
+        self.chars_per_second = chars_per_second
+        self.sample_rate = sample_rate
+
+    def synthesize(self, text):
+        time.sleep(self.base_seconds + self.seconds_per_char * len(text))
+        n_frames = int(self.sample_rate * len(text) / self.chars_per_second)
+        tone = b"".join(struct.pack("<h", int(3000 * math.sin(2 * math.pi * 220 * i / self.sample_rate))) for i in range(min(n_frames, 2400)))
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes((tone * (n_frames // 2400 + 1))[:n_frames * 2])
+        return buffer.getvalue()
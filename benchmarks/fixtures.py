@@ -0,0 +1,119 @@
+import csv
+import os
+import random
+import docx
+
+# Characters of text in a generated page and in one of its lines, about a page of a report
+PAGE_CHARS = 3000
+LINE_CHARS = 90
+# CSV rows that count as one page
+ROWS_PER_PAGE = 40
+
+WORDS = [
+    "report", "quarter", "budget", "customer", "supplier", "invoice", "delivery", "contract", "review", "meeting",
+    "planning", "forecast", "revenue", "margin", "warehouse", "shipment", "training", "policy", "audit", "risk",
+    "schedule", "milestone", "release", "support", "request", "approval", "payment", "travel", "office", "team",
+]
+NOUNS = ["Heron", "Falcon", "Otter", "Lynx", "Cedar", "Maple", "Comet", "Nova", "Atlas", "Delta", "Orbit", "Summit"]
+OWNERS = ["Alice Jansen", "Bob Garcia", "Carmen Tanaka", "Daan Rossi", "Emma Dubois", "Farid Smith", "Greta Bakker", "Hiro Lopez"]
+TEAMS = ["finance", "engineering", "sales", "marketing", "legal", "support", "operations"]
+# Filler sentences share the common words of the questions, like real text does
+TEMPLATES = [
+    "The {0} of the {1} is what the {team} team reviews before the {2}.",
+    "A new {0} for the {1} is sent with every {2} {3}.",
+    "Each {0} of the {team} team is checked against the {1} and the {2}.",
+    "The {0} is due after the {1}, the {2} of the {3} is not changed.",
+]
+
+def make_fact(rng, kind, number):
+    # A project with a unique name and code, the benchmark asks for the code and checks the retrieved chunks
+    return {
+        "project": f"{rng.choice(NOUNS)}{kind.upper()}{number}",
+        "code": f"{rng.randrange(16 ** 6):06X}",
+        "owner": rng.choice(OWNERS),
+        "team": rng.choice(TEAMS),
+        "budget": str(rng.randrange(1_000, 500_000)),
+    }
+
+def make_page_lines(rng, fact):
+    # Filler sentences with the fact of the page in the middle, wrapped in lines of LINE_CHARS
+    sentences = []
+    while sum(len(sentence) + 1 for sentence in sentences) < PAGE_CHARS:
+        sentences.append(rng.choice(TEMPLATES).format(*rng.sample(WORDS, 4), team=rng.choice(TEAMS)))
+    sentences.insert(len(sentences) // 2, f"The project code of {fact['project']} is {fact['code']}, it is led by {fact['owner']} from the {fact['team']} team.")
+    lines, line = [], ""
+    for word in " ".join(sentences).split(" "):
+        if line and len(line) + len(word) + 1 > LINE_CHARS:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    lines.append(line)
+    return lines
+
+def write_pdf(path, pages):
+    # Minimal text only PDF written by hand, one content stream per page in the standard Helvetica font.
+    # The generated text has no parentheses or backslashes, so it needs no escaping.
+    n_pages = len(pages)
+    font = 3 + 2 * n_pages
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(n_pages))}] /Count {n_pages} >>".encode(),
+    ]
+    for i, lines in enumerate(pages):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 {font} 0 R >> >> /Contents {4 + 2 * i} 0 R >>".encode())
+        content = "BT /F1 9 Tf 40 750 Td 12 TL " + " ".join(f"({line}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    data, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref_offset = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    data += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(data)
+
+def write_docx(path, pages):
+    # One paragraph per page, separated by page breaks
+    word_doc = docx.Document()
+    for i, lines in enumerate(pages):
+        if i:
+            word_doc.add_page_break()
+        word_doc.add_paragraph(" ".join(lines))
+    word_doc.save(path)
+
+def write_txt(path, pages):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join("\n".join(lines) for lines in pages))
+
+def write_csv(path, facts):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(facts[0]))
+        writer.writeheader()
+        writer.writerows(facts)
+
+def generate_fixtures(folder, pages, seed=0):
+    # Writes a PDF, a DOCX, a TXT and a CSV file of the given number of pages each to folder.
+    # Returns (files, facts): files are (name, path, pages) tuples, facts are the projects mentioned in the files
+    # with the name of their file as "source".
+    # The same pages and seed always give the same files.
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    files, all_facts = [], []
+    for kind, write in [("pdf", write_pdf), ("docx", write_docx), ("txt", write_txt)]:
+        facts = [make_fact(rng, kind, i) for i in range(pages)]
+        path = os.path.join(folder, f"fixture-{pages}.{kind}")
+        write(path, [make_page_lines(rng, fact) for fact in facts])
+        files.append((os.path.basename(path), path, pages))
+        all_facts += [dict(fact, source=os.path.basename(path)) for fact in facts]
+
+    facts = [make_fact(rng, "csv", i) for i in range(pages * ROWS_PER_PAGE)]
+    path = os.path.join(folder, f"fixture-{pages}.csv")
+    write_csv(path, facts)
+    files.append((os.path.basename(path), path, pages))
+    all_facts += [dict(fact, source=os.path.basename(path)) for fact in facts]
+    return files, all_facts
@@ -0,0 +1,179 @@
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+# The benchmarks are run as scripts, so the project root is added to the import path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The page reads the key when it is imported, nothing is sent to OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "sk-check")
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+import Chat_With_Multiple_Files as page
+import chat_history
+from answer_cache import AnswerCache
+from chat_history import ChatHistory
+from document_pipeline import iter_document_records
+from embedding_cache import CachedEmbeddings
+from hybrid_retrieval import LexicalIndex, get_term_frequencies
+from memory_store import MemoryStore
+from vector_index import get_index_type
+from fakes import HashingEmbeddings
+
+# Streamlit warns about every cached call used outside "streamlit run"
+for logger_name in list(logging.root.manager.loggerDict):
+    if logger_name.startswith("streamlit"):
+        logging.getLogger(logger_name).setLevel(logging.ERROR)
+
+class CountingEmbeddings(HashingEmbeddings):
+    # Counts the texts sent to the model
+    def __init__(self):
+        super().__init__()
+        self.texts = 0
+
+    def embed_documents(self, texts):
+        self.texts += len(texts)
+        return super().embed_documents(texts)
+
+class Upload(io.BytesIO):
+    # Stand-in for the files of st.file_uploader
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+        self.file_id = f"{name}-{len(data)}"
+
+def text_upload(name, paragraphs):
+    return Upload(name, "\n\n".join(f"Paragraph {i} of {name} is about the project {name[0]}{i}." for i in range(paragraphs)).encode())
+
+def check(condition, message):
+    if not condition:
+        sys.exit(f"FAILED: {message}")
+    print(f"ok: {message}")
+
+def check_update_vectorstore(tmp_dir):
+    # The multiple files page with the hashing embedder, a character splitter and its caches in a temporary folder
+    page.INDEX_CACHE_DIR = os.path.join(tmp_dir, "vector-index")
+    page.TABLE_CACHE_DIR = os.path.join(tmp_dir, "csv-tables")
+    model = CountingEmbeddings()
+    embeddings = CachedEmbeddings(model, os.path.join(tmp_dir, "embeddings.sqlite"), namespace="hashing")
+    page.get_embeddings = lambda: embeddings
+    splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=0)
+    page.get_text_splitter = lambda: splitter
+
+    lexical_index, indexed_docs = LexicalIndex(), {}
+    first, second = text_upload("alpha.txt", 12), text_upload("beta.txt", 8)
+    vectorstore = page.update_vectorstore(None, lexical_index, indexed_docs, [first])
+    n_first = vectorstore.index.ntotal
+    check(n_first > 0 and len(lexical_index) == n_first, "a new file is embedded and added to both indexes")
+
+    vectorstore = page.update_vectorstore(vectorstore, lexical_index, indexed_docs, [first, second])
+    n_both = vectorstore.index.ntotal
+    check(n_both > n_first and len(lexical_index) == n_both and len(indexed_docs) == 2, "a second file is added next to the first")
+
+    embedded_texts = model.texts
+    same_vectorstore = page.update_vectorstore(vectorstore, lexical_index, indexed_docs, [first, text_upload("beta.txt", 8)])
+    check(same_vectorstore is vectorstore and vectorstore.index.ntotal == n_both, "uploading an identical file again changes nothing")
+    check(model.texts == embedded_texts, "an identical file is not embedded again")
+
+    vectorstore = page.update_vectorstore(vectorstore, lexical_index, indexed_docs, [second])
+    check(vectorstore.index.ntotal == n_both - n_first and len(lexical_index) == n_both - n_first, "removing a file deletes its vectors and keywords")
+    check(all(document.metadata["source"] == "beta.txt" for document in vectorstore.docstore._dict.values()), "only the chunks of the remaining file are left")
+
+    vectorstore = page.update_vectorstore(vectorstore, lexical_index, indexed_docs, [first, second], index_type="hnsw")
+    check(get_index_type(vectorstore.index) == "hnsw" and vectorstore.index.ntotal == n_both, "a cached file comes back and the index is rebuilt as HNSW")
+    vectorstore = page.update_vectorstore(vectorstore, lexical_index, indexed_docs, [first], index_type="hnsw")
+    check(vectorstore.index.ntotal == n_first and len(lexical_index) == n_first, "removing a file from an approximate index rebuilds it without that file")
+    vectorstore = page.update_vectorstore(vectorstore, lexical_index, indexed_docs, [first], index_type="flat")
+    check(get_index_type(vectorstore.index) == "flat" and vectorstore.index.ntotal == n_first, "the index is rebuilt as flat with the same vectors")
+
+def check_lexical_index():
+    lexical_index = LexicalIndex()
+    lexical_index.add(get_term_frequencies({"a-0": "heron project budget", "a-1": "falcon project team", "b-0": "heron launch date"}))
+    check(sorted(chunk_id for chunk_id, _ in lexical_index.search("heron", k=4)) == ["a-0", "b-0"], "keyword search finds every chunk with the term")
+    lexical_index.remove(["a-0", "a-1", "missing"])
+    check(len(lexical_index) == 1 and [chunk_id for chunk_id, _ in lexical_index.search("heron project", k=4)] == ["b-0"], "removed chunks are not found any more")
+    check("project" not in lexical_index.postings and lexical_index.total_length == 3, "terms and lengths of removed chunks are dropped")
+
+def check_memory_store(tmp_dir):
+    memory_store = MemoryStore(os.path.join(tmp_dir, "user-memory.sqlite"))
+    applied = memory_store.apply_operations([
+        {"op": "add", "section": "hobbies", "content": " Climbing "},
+        {"op": "add", "section": "tasks", "content": "Call the bank"},
+        {"op": "add", "section": "unknown", "content": "Dropped"},
+        {"op": "add", "section": "hobbies", "content": None},
+        {"op": "update", "id": "x", "content": "Dropped"},
+    ])
+    items = memory_store.items()
+    check(applied == 2 and [content for _, _, content, _ in items] == ["Climbing", "Call the bank"], "valid operations are applied and malformed ones skipped")
+    climbing_id, bank_id = items[0][0], items[1][0]
+    applied = memory_store.apply_operations([{"op": "update", "id": climbing_id, "content": "Bouldering"}, {"op": "delete", "id": str(bank_id)}, {"op": "delete", "id": 999}])
+    check(applied == 2 and [content for _, _, content, _ in memory_store.items()] == ["Bouldering"], "updates and deletes change only existing items")
+
+def check_chat_history():
+    # Counted in words so the check runs offline, the tokenizer is loaded from the network
+    count_tokens = chat_history.count_tokens
+    chat_history.count_tokens = lambda text: len(text.split())
+    try:
+        history = ChatHistory(token_budget=60, token_target=30)
+        messages = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "word " * 8} for i in range(4)]
+        summaries = []
+        check(not history.compact(messages, lambda summary, old: summaries.append(old) or "summary") and not summaries, "a history within the budget is not summarized")
+
+        messages += [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "word " * 8} for i in range(4, 8)]
+        check(history.compact(messages, lambda summary, old: summaries.append(old) or "summary of " + str(len(old))), "a history over the budget is summarized")
+        context = history.get_context(messages)
+        check(context[0]["content"].endswith(f"summary of {history.summarized}") and context[1:] == messages[history.summarized:], "the context is the summary plus the recent messages")
+        check(chat_history.count_message_tokens(context[1:]) <= 30 and len(context) - 1 >= chat_history.MIN_RECENT_MESSAGES, "the recent messages fit the target")
+        check(len(history.get_context(messages + [messages[-1]])) == len(context), "a repeated message is sent once")
+    finally:
+        chat_history.count_tokens = count_tokens
+
+def check_answer_cache():
+    embeddings = HashingEmbeddings()
+    answer_cache = AnswerCache(max_entries=2)
+    answer_cache.put("docs", "What skills does Bob have?", "Bob knows Python.", embed=embeddings.embed_query)
+    check(answer_cache.get("docs", "what skills does bob have") == "Bob knows Python.", "a question is found by its normalized text")
+    check(answer_cache.get("other docs", "What skills does Bob have?") is None, "answers of other documents are not shared")
+    check(answer_cache.get("docs", "Which skills does Bob have?", embed=embeddings.embed_query, similarity=0.5) == "Bob knows Python.", "a similar wording is found above the threshold")
+    check(answer_cache.get("docs", "What skills does Alice have?", embed=embeddings.embed_query, similarity=0.5) is None, "a question about another name is not similar")
+
+    answer_cache.put("docs", "Who leads Heron?", "Alice.")
+    answer_cache.put("docs", "Who leads Falcon?", "Bob.")
+    check(answer_cache.get("docs", "What skills does Bob have?") is None and answer_cache.get_metrics()["evictions"] == 1, "the least recently used answer is evicted")
+    expiring_cache = AnswerCache(ttl_seconds=0.01)
+    expiring_cache.put("docs", "Who leads Heron?", "Alice.")
+    time.sleep(0.02)
+    check(expiring_cache.get("docs", "Who leads Heron?") is None, "answers expire after their TTL")
+
+def check_document_records(tmp_dir):
+    # A broken file is reported on its own, the records of the other files still come out
+    paths = {}
+    for name, data in [("good.txt", b"Some text about the heron project."), ("broken.pdf", b"%PDF-1.4 not a real file"), ("table.csv", b"project,code\nheron,H-1\n")]:
+        paths[name] = os.path.join(tmp_dir, name)
+        with open(paths[name], "wb") as f:
+            f.write(data)
+    errors = []
+    records = list(iter_document_records(list(paths.items()), max_workers=2, on_error=lambda document, error: errors.append(document)))
+    check(errors == ["broken.pdf"], "a file that can not be parsed is reported")
+    check(sorted({document for document, _, _ in records}) == ["good.txt", "table.csv"], "the other files are still parsed")
+    try:
+        list(iter_document_records([("broken.pdf", paths["broken.pdf"])], max_workers=1))
+        raised = False
+    except Exception:
+        raised = True
+    check(raised, "without on_error the error is raised")
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        check_update_vectorstore(tmp_dir)
+        check_lexical_index()
+        check_memory_store(tmp_dir)
+        check_chat_history()
+        check_answer_cache()
+        check_document_records(tmp_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import faiss
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+# Unix only, the peak RSS metrics are left out on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# The benchmarks are run as scripts, so the project root is added to the import path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The page reads the key when it is imported, nothing is sent to OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langchain.chains import ConversationalRetrievalChain
+from langchain.memory import ConversationBufferMemory
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+import Chat_With_Multiple_Files as page
+from document_pipeline import get_mp_context, iter_document_records
+from embedding_cache import CachedEmbeddings
+from hybrid_retrieval import HybridRetriever, LexicalIndex, get_term_frequencies
+from vector_index import build_vectorstore, get_index_type
+from fakes import HashingEmbeddings
+from fixtures import generate_fixtures
+
+# Streamlit warns about every cached call used outside "streamlit run"
+for logger_name in list(logging.root.manager.loggerDict):
+    if logger_name.startswith("streamlit"):
+        logging.getLogger(logger_name).setLevel(logging.ERROR)
+
+# Pages of every fixture file (PDF, DOCX, TXT and CSV) at each scale
+SCALES = {"small": 10, "medium": 50, "large": 250}
+
+# Results of an earlier run, created with --save-baseline. Timings of different machines are not comparable, so after
+# changing machines run the benchmark once with --save-baseline on the old commit and compare the new one against it.
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingestion_baseline.json")
+
+# Metrics compared with the baseline: (1 if higher is better else -1, relative change flagged as a regression,
+# smallest absolute change flagged). Latencies of a few milliseconds vary by more than half between runs on an
+# idle machine, the absolute floor keeps that noise from counting as a regression.
+METRICS = {
+    "pages_per_second": (1, 0.2, 0),
+    "chunks_per_second": (1, 0.2, 0),
+    "peak_rss_mb": (-1, 0.2, 20),
+    "worker_peak_rss_mb": (-1, 0.2, 20),
+    "query_p50_ms": (-1, 0.3, 1),
+    "query_p95_ms": (-1, 0.5, 2),
+    "answer_p50_ms": (-1, 0.3, 2),
+    "answer_p95_ms": (-1, 0.5, 5),
+    "recall": (1, 0.02, 0),
+}
+
+# Parse workers of every run, fixed so that results of machines with different CPU counts use the same settings
+DEFAULT_WORKERS = 2
+
+def get_text_splitter():
+    # The splitter of the page, or a character splitter of about the same size when the tokenizer cannot be
+    # loaded offline. Its name is kept with the results, runs with different splitters are not compared.
+    try:
+        return "tiktoken", page.get_text_splitter.__wrapped__()
+    except Exception:
+        return "characters", RecursiveCharacterTextSplitter(
+            separators=page.CHUNK_SEPARATORS,
+            is_separator_regex=True,
+            chunk_size=page.CHUNK_TOKENS * 4,
+            chunk_overlap=page.CHUNK_OVERLAP_TOKENS * 4
+        )
+
+def get_peak_rss_mb(children=False):
+    # Of this process or of its finished child processes. ru_maxrss is in kilobytes on Linux and in bytes on macOS,
+    # None where the resource module is missing.
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    return round(resource.getrusage(who).ru_maxrss / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def add_chunks(doc_index, name, first_id, chunks, embeddings, lexical_index):
+    # Embeds one batch of chunks into the index of a file and adds their keyword statistics, like build_document_index
+    ids = [f"{name}-{first_id + i}" for i in range(len(chunks))]
+    if doc_index is None:
+        doc_index = FAISS.from_documents(documents=chunks, embedding=embeddings, ids=ids)
+    else:
+        doc_index.add_documents(chunks, ids=ids)
+    lexical_index.add(get_term_frequencies({chunk_id: chunk.page_content for chunk_id, chunk in zip(ids, chunks)}))
+    return doc_index
+
+def run_scale(pages, workers, n_queries, seed):
+    # Ingests the fixtures of one scale the way the multiple files page does and asks questions about them.
+    # Runs in its own process, so the peak RSS belongs to this scale only.
+    splitter_name, splitter = get_text_splitter()
+    # The app starts the fork server of the parse workers once per process, the time it takes to import the
+    # modules of the main module is left out like the import times, which are measured by startup_time.py
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_mp_context()) as executor:
+        executor.submit(os.getpid).result()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files, facts = generate_fixtures(os.path.join(tmp_dir, "fixtures"), pages, seed)
+        embeddings = CachedEmbeddings(HashingEmbeddings(), os.path.join(tmp_dir, "embeddings.sqlite"), namespace="hashing")
+
+        # Parse and chunk every file page by page, and embed its chunks in batches as they arrive, like
+        # iter_document_chunks and build_document_index. The time spent waiting for the records and chunking them
+        # is the parse time, the time spent embedding and saving the file indexes is the embed time.
+        parse_seconds, embed_seconds, n_chunks = 0.0, 0.0, 0
+        index_paths, lexical_index = [], LexicalIndex()
+        records = iter_document_records([(name, path) for name, path, _ in files], max_workers=workers, tables_dir=os.path.join(tmp_dir, "tables"))
+        start_time = time.perf_counter()
+        for name, file_records in itertools.groupby(records, key=lambda record: record[0]):
+            doc_index, batch, first_id = None, [], 0
+            for _, location, text in file_records:
+                batch += splitter.create_documents([text], metadatas=[{"source": name, **location}])
+                parse_seconds += time.perf_counter() - start_time
+                start_time = time.perf_counter()
+                while len(batch) >= page.INDEX_BATCH_CHUNKS:
+                    doc_index = add_chunks(doc_index, name, first_id, batch[:page.INDEX_BATCH_CHUNKS], embeddings, lexical_index)
+                    first_id += page.INDEX_BATCH_CHUNKS
+                    batch = batch[page.INDEX_BATCH_CHUNKS:]
+                embed_seconds += time.perf_counter() - start_time
+                start_time = time.perf_counter()
+            parse_seconds += time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            if batch:
+                doc_index = add_chunks(doc_index, name, first_id, batch, embeddings, lexical_index)
+            if doc_index is not None:
+                index_path = os.path.join(tmp_dir, "index", name)
+                doc_index.save_local(index_path)
+                index_paths.append(index_path)
+                n_chunks += first_id + len(batch)
+            embed_seconds += time.perf_counter() - start_time
+            start_time = time.perf_counter()
+
+        # The parse workers are children of the fork server, which reaps them. It is stopped here, so their peak is
+        # included in RUSAGE_CHILDREN of this process.
+        if get_mp_context().get_start_method() == "forkserver":
+            multiprocessing.forkserver._forkserver._stop()
+
+        # Combine the file indexes into the searchable vectorstore, like update_vectorstore
+        start_time = time.perf_counter()
+        vectorstore = build_vectorstore(embeddings, index_paths, page.INDEX_TYPE)
+        index_seconds = time.perf_counter() - start_time
+
+        # Retrieval alone, and the retrieval chain of the page with a fake model that answers instantly
+        retriever = HybridRetriever(
+            vectorstore=vectorstore,
+            lexical_index=lexical_index,
+            k=page.RETRIEVAL_K,
+            vector_weight=page.VECTOR_WEIGHT,
+            lexical_weight=page.LEXICAL_WEIGHT
+        )
+        llm = FakeListChatModel(responses=["The project code is in the sources."])
+        conversation = ConversationalRetrievalChain.from_llm(
+            llm=llm,
+            retriever=retriever,
+            condense_question_llm=llm,
+            memory=ConversationBufferMemory(memory_key='chat_history', output_key='answer', return_messages=True),
+            return_source_documents=True
+        )
+        # The same number of questions about every file, the CSV file mentions far more projects than the others.
+        # The hashing embedder ranks the chunks far worse than a real model, the recall only shows changes between runs.
+        rng = random.Random(seed)
+        queries = []
+        for name, _, _ in files:
+            file_facts = [fact for fact in facts if fact["source"] == name]
+            queries += rng.sample(file_facts, min(len(file_facts), n_queries // len(files)))
+        query_times, answer_times, hits = [], [], 0
+        for fact in queries:
+            question = f"What is the project code of {fact['project']}?"
+            start_time = time.perf_counter()
+            documents = retriever.invoke(question)
+            query_times.append((time.perf_counter() - start_time) * 1000)
+            hits += any(fact["code"] in document.page_content and document.metadata["source"] == fact["source"] for document in documents)
+            start_time = time.perf_counter()
+            conversation.invoke({"question": question})
+            answer_times.append((time.perf_counter() - start_time) * 1000)
+
+        n_pages = sum(file_pages for _, _, file_pages in files)
+        ingest_seconds = parse_seconds + embed_seconds + index_seconds
+        return {
+            "splitter": splitter_name,
+            "index_type": get_index_type(vectorstore.index),
+            "pages": n_pages,
+            "chunks": n_chunks,
+            "megabytes": round(sum(os.path.getsize(path) for _, path, _ in files) / (1 << 20), 2),
+            "parse_seconds": round(parse_seconds, 3),
+            "embed_seconds": round(embed_seconds, 3),
+            "index_seconds": round(index_seconds, 3),
+            "pages_per_second": round(n_pages / ingest_seconds, 2),
+            "chunks_per_second": round(n_chunks / ingest_seconds, 2),
+            "peak_rss_mb": get_peak_rss_mb(),
+            "worker_peak_rss_mb": get_peak_rss_mb(children=True),
+            "query_p50_ms": round(percentile(query_times, 0.5), 3),
+            "query_p95_ms": round(percentile(query_times, 0.95), 3),
+            "answer_p50_ms": round(percentile(answer_times, 0.5), 3),
+            "answer_p95_ms": round(percentile(answer_times, 0.95), 3),
+            "recall": round(hits / len(queries), 3),
+        }
+
+def get_median_metrics(runs):
+    # Median of every number over the runs of a scale, the other values are the same in every run
+    return {name: statistics.median(run[name] for run in runs) if isinstance(value, (int, float)) else value for name, value in runs[0].items()}
+
+def compare(results, baseline):
+    # Returns a line per metric that got worse than its tolerance and the scales that were compared.
+    # Scales or settings missing from the baseline are skipped.
+    regressions, compared = [], []
+    if results["settings"] != baseline.get("settings"):
+        print(f"baseline settings {baseline.get('settings')} differ from {results['settings']}, not compared")
+        return regressions, compared
+    for scale, metrics in results["scales"].items():
+        old_metrics = baseline["scales"].get(scale)
+        if old_metrics is None or old_metrics.get("splitter") != metrics["splitter"]:
+            print(f"{scale}: no comparable baseline")
+            continue
+        compared.append(scale)
+        for name, (direction, tolerance, floor) in METRICS.items():
+            old, new = old_metrics.get(name), metrics[name]
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if direction * change < -tolerance and abs(new - old) > floor:
+                regressions.append(f"{scale} {name}: {old} -> {new} ({change:+.0%}, tolerance {tolerance:.0%})")
+    return regressions, compared
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion and retrieval benchmark on generated PDF, DOCX, TXT and CSV files, with a fake embedder and model.")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["small", "medium"])
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3, help="runs per scale, the median of every metric is kept")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="results to compare with, the committed one was saved on a Linux machine with --save-baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline instead of comparing")
+    parser.add_argument("--run-scale", choices=list(SCALES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scale:
+        print(json.dumps(run_scale(SCALES[args.run_scale], args.workers, args.queries, args.seed)))
+        return
+
+    results = {
+        "settings": {"workers": args.workers, "queries": args.queries, "seed": args.seed, "python": ".".join(platform.python_version_tuple()[:2])},
+        "scales": {},
+    }
+    for scale in args.scales:
+        # One process per run, the peak RSS of a process never goes down
+        runs = []
+        for _ in range(args.repeats):
+            process = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run-scale", scale, "--workers", str(args.workers), "--queries", str(args.queries), "--seed", str(args.seed)],
+                capture_output=True, text=True
+            )
+            # The output of the run is only shown when it fails, it is mostly deprecation warnings otherwise
+            if process.returncode:
+                sys.exit(f"{scale} failed:\n{process.stderr}")
+            runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+        metrics = results["scales"][scale] = get_median_metrics(runs)
+        print(f"{scale}: {metrics['pages']} pages, {metrics['chunks']} chunks, {metrics['megabytes']} MB ({metrics['splitter']} splitter, {metrics['index_type']} index)")
+        print(f"  ingest {metrics['pages_per_second']:.1f} pages/s {metrics['chunks_per_second']:.1f} chunks/s · "
+              f"parse {metrics['parse_seconds']:.2f}s embed {metrics['embed_seconds']:.2f}s index {metrics['index_seconds']:.2f}s")
+        rss = f"peak RSS {metrics['peak_rss_mb']:.0f} MB, parse workers {metrics['worker_peak_rss_mb']:.0f} MB" if metrics["peak_rss_mb"] is not None else "peak RSS not available"
+        print(f"  {rss} · "
+              f"query p50 {metrics['query_p50_ms']:.1f}ms p95 {metrics['query_p95_ms']:.1f}ms · "
+              f"answer p50 {metrics['answer_p50_ms']:.1f}ms p95 {metrics['answer_p95_ms']:.1f}ms · recall@{page.RETRIEVAL_K} {metrics['recall']:.0%}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return
+    if not os.path.isfile(args.baseline):
+        print(f"no baseline at {args.baseline}, run with --save-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        regressions, compared = compare(results, json.load(f))
+    # Nothing compared is not a pass, the baseline has to be saved again with these settings
+    if not compared:
+        sys.exit(f"nothing compared with {args.baseline}, run with the settings of the baseline or save a new one with --save-baseline")
+    if regressions:
+        print("regressions against the baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("no regressions against the baseline")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+
+# The benchmarks are run as scripts, so the project root is added to the import path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The page reads the key when it is imported, nothing is sent to OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+import tempfile
+import Chat_Assistant
+import Chat_With_Multiple_Files
+import conversation_chain
+import resources
+
+# Streamlit warns about every cached call used outside "streamlit run"
+for logger_name in list(logging.root.manager.loggerDict):
+    if logger_name.startswith("streamlit"):
+        logging.getLogger(logger_name).setLevel(logging.ERROR)
+
+# The embedding cache of the benchmark is a throwaway file, not the one of the app
+Chat_With_Multiple_Files.EMBEDDING_CACHE_PATH = os.path.join(tempfile.mkdtemp(prefix="rerun-overhead-"), "embeddings.sqlite")
+
+# Process wide resources of both pages, the ones a rerun used to create again
+RESOURCES = [
+    ("http client", resources.get_http_client, ()),
+    ("async client", resources.get_http_async_client, ()),
+    ("openai client", resources.get_openai_client, (os.environ["OPENAI_API_KEY"],)),
+    ("chat model", Chat_Assistant.get_llm, ()),
+    ("answer prompt", Chat_Assistant.get_answer_prompt, ()),
+    ("answer chain", Chat_Assistant.get_answer_chain, ()),
+    ("greeting chain", Chat_Assistant.get_greeting_chain, ()),
+    ("memory chain", Chat_Assistant.get_update_memory_chain, ()),
+    ("summary chain", Chat_Assistant.get_summary_chain, ()),
+    ("embeddings", Chat_With_Multiple_Files.get_embeddings, ()),
+    ("retrieval llms", conversation_chain.get_llms, ()),
+]
+
+class Handler(BaseHTTPRequestHandler):
+    # Stand-in for the API, answers every request with a small JSON body
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def time_ms(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start_time) * 1000)
+    return statistics.median(times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Per rerun cost of building clients, models and chains, and of opening new HTTP connections.")
+    parser.add_argument("--reruns", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"Median per rerun over {args.reruns} reruns")
+    print(f"{'resource':<16}{'built ms':>10}{'cached ms':>11}")
+    total_built, total_cached = 0.0, 0.0
+    for name, cached_function, arguments in RESOURCES:
+        built = time_ms(lambda: cached_function.__wrapped__(*arguments), args.reruns)
+        cached_function(*arguments)
+        cached = time_ms(lambda: cached_function(*arguments), args.reruns)
+        total_built += built
+        total_cached += cached
+        print(f"{name:<16}{built:>10.2f}{cached:>11.3f}")
+    print(f"{'total':<16}{total_built:>10.2f}{total_cached:>11.3f}")
+
+    # Local plain HTTP server, the saving is bigger against the real API where every new connection needs a TLS handshake
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+
+    def new_client_request():
+        with httpx.Client() as client:
+            client.get(url)
+
+    with httpx.Client() as pooled_client:
+        pooled = time_ms(lambda: pooled_client.get(url), args.requests)
+    fresh = time_ms(new_client_request, args.requests)
+    server.shutdown()
+    print(f"\nMedian per request over {args.requests} requests to a local server")
+    print(f"new client and connection {fresh:.3f} ms, pooled connection {pooled:.3f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+# The benchmarks are run as scripts, so the project root is added to the import path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.vectorstores import FAISS
+from hybrid_retrieval import LexicalIndex, HybridRetriever, dense_search, get_term_frequencies
+from fakes import HashingEmbeddings
+
+FIRST_NAMES = ["Bob", "Alice", "Carmen", "Daan", "Emma", "Farid", "Greta", "Hiro", "Ines", "Jonas", "Keiko", "Luca", "Maya", "Noor", "Oscar", "Priya"]
+LAST_NAMES = ["Jansen", "Garcia", "Tanaka", "Rossi", "Dubois", "Smith", "Bakker", "Lopez", "Sato", "Moreau", "Visser", "Ricci"]
+TEAMS = ["finance", "engineering", "sales", "marketing", "legal", "support", "operations"]
+SKILLS = ["python", "negotiation", "excel", "kubernetes", "public speaking", "accounting", "sql", "design", "contract law", "spanish", "java", "forecasting"]
+FILLER = [
+    "Employees are entitled to twenty-five vacation days per year.",
+    "Every team holds a weekly planning meeting on Monday morning.",
+    "Expense reports have to be submitted before the end of the month.",
+    "The office is closed on public holidays and during the last week of December.",
+    "New skills can be registered in the HR portal after a training is completed.",
+]
+
+def build_corpus(profiles, seed):
+    # One chunk per employee profile plus generic policy chunks that share a lot of vocabulary
+    rng = random.Random(seed)
+    names = [f"{first} {last}" for first in FIRST_NAMES for last in LAST_NAMES]
+    rng.shuffle(names)
+    texts, queries = [], []
+    for i, name in enumerate(names[:profiles]):
+        team = rng.choice(TEAMS)
+        skills = rng.sample(SKILLS, 3)
+        texts.append(f"{name} works in the {team} team. Skills: {', '.join(skills)}. {rng.choice(FILLER)}")
+        queries.append((f"What skills does {name} have?", f"profile-{i}"))
+        queries.append((f"Which team is {name} in?", f"profile-{i}"))
+    ids = [f"profile-{i}" for i in range(len(texts))]
+    for i in range(profiles):
+        texts.append(" ".join(rng.sample(FILLER, 3)))
+        ids.append(f"filler-{i}")
+    return ids, texts, queries
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run(search, queries, ks):
+    # Recall@k for every k (one relevant chunk per query) and latency of each search in milliseconds
+    hits = {k: 0 for k in ks}
+    latencies = []
+    for query, relevant_id in queries:
+        start_time = time.perf_counter()
+        ranked_ids = search(query, max(ks))
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        for k in ks:
+            if relevant_id in ranked_ids[:k]:
+                hits[k] += 1
+    return {k: hits[k] / len(queries) for k in ks}, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k and query latency of dense, BM25 and hybrid retrieval on a synthetic HR corpus.")
+    parser.add_argument("--profiles", type=int, default=150, help="number of employee profiles (max 192)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--vector-weight", type=float, default=0.5)
+    parser.add_argument("--lexical-weight", type=float, default=0.5)
+    args = parser.parse_args()
+    ks = [1, 4, 10]
+
+    ids, texts, queries = build_corpus(args.profiles, args.seed)
+    queries = random.Random(args.seed).sample(queries, min(args.queries, len(queries)))
+
+    # Both indexes are built in the same pass over the chunks, like in the app
+    start_time = time.perf_counter()
+    vectorstore = FAISS.from_texts(texts=texts, embedding=HashingEmbeddings(), ids=ids)
+    lexical_index = LexicalIndex()
+    lexical_index.add(get_term_frequencies(dict(zip(ids, texts))))
+    print(f"Indexed {len(texts)} chunks in {time.perf_counter() - start_time:.2f}s, {len(queries)} queries")
+
+    hybrid = HybridRetriever(vectorstore=vectorstore, lexical_index=lexical_index, vector_weight=args.vector_weight, lexical_weight=args.lexical_weight)
+
+    def hybrid_search(query, k):
+        hybrid.k = k
+        return hybrid.get_ranked_ids(query)
+
+    searches = {
+        "dense": lambda query, k: dense_search(vectorstore, query, k),
+        "bm25": lambda query, k: [chunk_id for chunk_id, _ in lexical_index.search(query, k)],
+        "hybrid": hybrid_search,
+    }
+
+    print(f"{'retriever':<10}" + "".join(f"{f'recall@{k}':>11}" for k in ks) + f"{'p50 ms':>9}{'p95 ms':>9}")
+    for name, search in searches.items():
+        recall, latencies = run(search, queries, ks)
+        print(f"{name:<10}" + "".join(f"{recall[k]:>11.3f}" for k in ks) + f"{statistics.median(latencies):>9.2f}{percentile(latencies, 0.95):>9.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The benchmarks are run as scripts, so the project root is added to the import path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
+from assistant_service import AssistantService, ServiceBusy
+from memory_store import parse_operations
+
+ANSWER = "Sure, I noted that. Your dentist appointment is tomorrow at nine, and the report is due on Friday. Anything else?"
+
+def make_handler(first_token_seconds, tokens_per_second):
+    class Handler(BaseHTTPRequestHandler):
+        # Stand-in for the OpenAI chat completions endpoint, streams a fixed answer at a steady rate.
+        # Memory update prompts get a JSON array with one operation.
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            prompt = " ".join(str(message.get("content", "")) for message in request["messages"])
+            text = json.dumps([{"op": "add", "section": "tasks", "content": f"task {time.time():.6f}"}]) if "JSON array" in prompt else ANSWER
+            time.sleep(first_token_seconds)
+            if not request.get("stream"):
+                body = json.dumps({
+                    "id": "chatcmpl-local", "object": "chat.completion", "created": 0, "model": request["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for i, token in enumerate(text.split(" ")):
+                if i:
+                    time.sleep(1.0 / tokens_per_second)
+                self._send_chunk(request["model"], {"content": token if i == 0 else " " + token}, None)
+            self._send_chunk(request["model"], {}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def _send_chunk(self, model, delta, finish_reason):
+            chunk = {"id": "chatcmpl-local", "object": "chat.completion.chunk", "created": 0, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else (values[0] if values else 0.0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the assistant service against a local stand-in for the OpenAI API.")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-pending", type=int, default=64)
+    parser.add_argument("--first-token-seconds", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.first_token_seconds, args.tokens_per_second))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    llm = ChatOpenAI(model="gpt-4o-mini", base_url=f"http://127.0.0.1:{server.server_port}/v1", api_key="sk-load-test", streaming=True, max_retries=0)
+    answer_chain = ChatPromptTemplate.from_messages([("system", "User memory: {user_memory}"), ("human", "{question}")]) | llm | StrOutputParser()
+    memory_chain = ChatPromptTemplate.from_messages([("system", "Respond with a JSON array of operations."), ("human", "{question}")]) | llm | StrOutputParser()
+
+    memory_dir = tempfile.mkdtemp(prefix="service-load-test-")
+    service = AssistantService(memory_dir, max_concurrency=args.concurrency, max_pending=args.max_pending)
+    first_tokens, totals, rejected, failed = [], [], [], []
+
+    async def update_memory(user_id, question):
+        service.get_memory_store(user_id).apply_operations(parse_operations(await memory_chain.ainvoke({"question": question})))
+
+    def run_user(user_id):
+        # One browser session: questions one after the other, each followed by a background memory update
+        for i in range(args.questions):
+            question = f"Question {i} of {user_id}: what do I have to do tomorrow?"
+            inputs = {"user_memory": service.get_memory_store(user_id).render(), "question": question}
+            start_time = time.perf_counter()
+            first_token = None
+            try:
+                for _ in service.stream(user_id, answer_chain.astream, inputs):
+                    if first_token is None:
+                        first_token = time.perf_counter() - start_time
+            except ServiceBusy:
+                rejected.append(user_id)
+                continue
+            except Exception as e:
+                failed.append(e)
+                continue
+            first_tokens.append(first_token)
+            totals.append(time.perf_counter() - start_time)
+            service.submit_latest(user_id, "memory", update_memory, user_id, question)
+
+    start_time = time.perf_counter()
+    threads = [threading.Thread(target=run_user, args=(f"user-{i}",)) for i in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+    # Let the last memory updates finish before counting the items
+    while service.get_stats()["in_flight"]:
+        time.sleep(0.05)
+    time.sleep(0.5)
+    server.shutdown()
+
+    stats = service.get_stats()
+    items = [len(service.get_memory_store(f"user-{i}").items()) for i in range(args.users)]
+    print(f"{args.users} users x {args.questions} questions, concurrency {args.concurrency}, max pending {args.max_pending}")
+    print(f"answered {len(totals)}, rejected {len(rejected)}, failed {len(failed)} in {elapsed:.2f}s ({len(totals) / elapsed:.1f} answers/s)")
+    if totals:
+        print(f"first token p50 {percentile(first_tokens, 50):.3f}s p95 {percentile(first_tokens, 95):.3f}s · "
+              f"total p50 {percentile(totals, 50):.3f}s p95 {percentile(totals, 95):.3f}s")
+    print(f"max in flight {stats['max_in_flight']}, memory items per user min {min(items)} max {max(items)}, memory folders in {memory_dir}")
+    if failed:
+        print(f"first failure: {failed[0]!r}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# The benchmarks are run as scripts, so the project root is added to the import path
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+PAGES = ["Home.py", "Chat_Assistant.py", "Chat_With_Multiple_Files.py"]
+
+# Packages that take a noticeable time to import, a page should only load them once it needs them
+HEAVY_MODULES = [
+    "langchain", "langchain_core", "langchain_openai", "langchain_community", "openai",
+    "faiss", "numpy", "pyarrow", "PyPDF2", "docx", "audio_recorder_streamlit",
+]
+
+def measure_import(page):
+    # Imports the page as a module, main() does not run
+    import streamlit
+    start_time = time.perf_counter()
+    importlib.import_module(os.path.splitext(page)[0])
+    return {"import_seconds": time.perf_counter() - start_time, "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules]}
+
+def measure_first_paint(page):
+    # Runs the page like a first visit, every import of the page is still cold, then reruns it like a widget change
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(os.path.join(PROJECT_DIR, page), default_timeout=120)
+    start_time = time.perf_counter()
+    app.run()
+    first_paint = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    app.run()
+    return {
+        "first_paint_seconds": first_paint,
+        "rerun_seconds": time.perf_counter() - start_time,
+        "errors": [str(exception.value) for exception in app.exception],
+    }
+
+def run_child(page, mode, work_dir):
+    # A fresh process per measurement, nothing is imported yet. The data folders of the pages end up in work_dir,
+    # and the API address does not exist, so a greeting generated in the background fails at once instead of going out.
+    env = dict(os.environ, OPENAI_API_KEY="sk-startup-time", OPENAI_BASE_URL="http://127.0.0.1:9/v1", PYTHONWARNINGS="ignore")
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), f"--{mode}", page], cwd=work_dir, env=env, capture_output=True, text=True)
+    if process.returncode:
+        sys.exit(f"{page} {mode} failed:\n{process.stderr}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold import and first paint time of every page, each measured in a fresh process.")
+    parser.add_argument("--pages", nargs="+", choices=PAGES, default=PAGES)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--import", dest="import_page", help=argparse.SUPPRESS)
+    parser.add_argument("--first-paint", dest="first_paint_page", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.import_page:
+        print(json.dumps(measure_import(args.import_page)))
+        return
+    if args.first_paint_page:
+        print(json.dumps(measure_first_paint(args.first_paint_page)))
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # The pages keep their data in ../<project>/data relative to the working directory
+        work_dir = os.path.join(tmp_dir, "app")
+        os.makedirs(work_dir)
+        for page in args.pages:
+            imports = [run_child(page, "import", work_dir) for _ in range(args.repeats)]
+            paints = [run_child(page, "first-paint", work_dir) for _ in range(args.repeats)]
+            results[page] = {
+                "import_seconds": round(statistics.median(run["import_seconds"] for run in imports), 3),
+                "first_paint_seconds": round(statistics.median(run["first_paint_seconds"] for run in paints), 3),
+                "rerun_seconds": round(statistics.median(run["rerun_seconds"] for run in paints), 3),
+                "heavy_modules": imports[0]["heavy_modules"],
+                "errors": paints[0]["errors"],
+            }
+            result = results[page]
+            print(f"{page}: import {result['import_seconds']:.2f}s · first paint {result['first_paint_seconds']:.2f}s · rerun {result['rerun_seconds']:.3f}s")
+            print(f"  loaded on import: {', '.join(result['heavy_modules']) or 'none of the heavy packages'}")
+            for error in result["errors"]:
+                print(f"  error: {error}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import os
+import sys
+import time
+
+# The benchmarks are run as scripts, so the project root is added to the import path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from speech_pipeline import TTS_CONCURRENCY, get_wav_duration, iter_sentences, synthesize_in_order
+from fakes import FakeSpeech, fake_token_stream
+
+ANSWER = (
+    "Sure, here is your plan for tomorrow. At nine you have the dentist appointment, so leave home around half past eight. "
+    "After that you wanted to finish the quarterly report, which should take most of the morning. "
+    "Lunch with Carmen is at one in the usual place near the office. "
+    "In the afternoon there is the weekly planning meeting, remember to bring the numbers of last month. "
+    "Your gym schedule says legs and core at six, and you still have to buy milk and bread on the way back. "
+    "Finally, do not forget to call your mother, it is her birthday on Friday. Is there anything else I can help you with?"
+)
+
+def run_whole_text(speech, tokens_per_second):
+    # What the app did before: wait for the whole answer, then synthesize it in a single request
+    start_time = time.perf_counter()
+    text = "".join(fake_token_stream(ANSWER, tokens_per_second))
+    audio = speech.synthesize(text)
+    first_audio = time.perf_counter() - start_time
+    return first_audio, first_audio, get_wav_duration(audio)
+
+def run_pipelined(speech, tokens_per_second, workers):
+    start_time = time.perf_counter()
+    first_audio, duration = None, 0.0
+    for audio in synthesize_in_order(iter_sentences(fake_token_stream(ANSWER, tokens_per_second)), speech.synthesize, max_workers=workers):
+        if first_audio is None:
+            first_audio = time.perf_counter() - start_time
+        duration += get_wav_duration(audio)
+    return first_audio, time.perf_counter() - start_time, duration
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to the first audio of a voice answer, with a fake LLM and TTS backend.")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--tts-base-seconds", type=float, default=0.4)
+    parser.add_argument("--workers", type=int, default=TTS_CONCURRENCY)
+    args = parser.parse_args()
+
+    speech = FakeSpeech(base_seconds=args.tts_base_seconds)
+    print(f"{len(ANSWER)} characters, {args.tokens_per_second:g} tokens/s, TTS request {args.tts_base_seconds:g}s + length")
+    print(f"{'mode':<12}{'first audio s':>15}{'all audio s':>13}{'audio length s':>16}")
+    for mode, run in [("whole text", lambda: run_whole_text(speech, args.tokens_per_second)),
+                      ("pipelined", lambda: run_pipelined(speech, args.tokens_per_second, args.workers))]:
+        first_audio, all_audio, duration = run()
+        print(f"{mode:<12}{first_audio:>15.2f}{all_audio:>13.2f}{duration:>16.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import tiktoken
+
+# Tokens of chat history sent with every prompt, older messages are folded into a rolling summary
+HISTORY_TOKEN_BUDGET = 2000
+# When the history goes over the budget it is compacted down to this, so the summary is not rewritten every turn
+HISTORY_TOKEN_TARGET = 1000
+# The last user prompt and answer are always sent as they are
+MIN_RECENT_MESSAGES = 2
+
+# Encoding of gpt-4o-mini, plus the tokens OpenAI adds around every chat message
+TOKEN_ENCODING = "o200k_base"
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+
+def count_tokens(text):
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+    return len(_encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(messages):
+    # Works for {"role", "content"} dicts and for langchain messages
+    total = 0
+    for message in messages:
+        content = message["content"] if isinstance(message, dict) else message.content
+        total += count_tokens(str(content)) + MESSAGE_OVERHEAD_TOKENS
+    return total
+
+def dedupe_messages(messages):
+    # Drops a message that repeats the previous one (same role and text), e.g. a voice prompt processed again on a rerun
+    deduped = []
+    for message in messages:
+        if deduped and deduped[-1]["role"] == message["role"] and deduped[-1]["content"] == message["content"]:
+            continue
+        deduped.append(message)
+    return deduped
+
+class ChatHistory:
+    # History of one chat sent to the LLM: a summary of the older messages followed by the latest ones as they are
+
+    def __init__(self, token_budget=HISTORY_TOKEN_BUDGET, token_target=HISTORY_TOKEN_TARGET):
+        self.token_budget = token_budget
+        self.token_target = token_target
+        self.summary = ""
+        # Number of (deduplicated) messages already folded into the summary
+        self.summarized = 0
+
+    def get_context(self, messages):
+        context = dedupe_messages(messages)[self.summarized:]
+        if self.summary:
+            context = [{"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"}] + context
+        return context
+
+    def compact(self, messages, summarize):
+        # Slides the window forward until the recent messages fit the target, summarize(summary, messages) returns
+        # the new summary for the previous one plus the messages that leave the window
+        messages = dedupe_messages(messages)
+        if count_message_tokens(messages[self.summarized:]) <= self.token_budget:
+            return False
+        start = self.summarized
+        window_tokens = count_message_tokens(messages[start:])
+        while start < len(messages) - MIN_RECENT_MESSAGES and window_tokens > self.token_target:
+            window_tokens -= count_message_tokens(messages[start:start + 1])
+            start += 1
+        if start == self.summarized:
+            return False
+        self.summary = summarize(self.summary, messages[self.summarized:start])
+        self.summarized = start
+        return True
@@ -0,0 +1,104 @@
+import asyncio
+import time
+import streamlit as st
+from langchain_openai import ChatOpenAI
+from langchain.chains import ConversationalRetrievalChain
+from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
+from langchain.callbacks.base import AsyncCallbackHandler, BaseCallbackHandler
+from hybrid_retrieval import HybridRetriever
+from resources import get_http_client, get_http_async_client
+from telemetry import TELEMETRY
+from chat_history import count_message_tokens
+
+# The retrieval chain of the multiple files page. It loads LangChain, so the page imports it with the first prompt.
+# The chain has no memory of its own, the page keeps the turns of the session and rewrites follow-ups with
+# condense_question before they reach the chain.
+
+class StreamHandler(BaseCallbackHandler):
+    # Writes the answer tokens in a streamlit container as they arrive and records the time to the first one
+
+    def __init__(self, container):
+        self.container = container
+        self.text = ""
+        self.start_time = time.perf_counter()
+        self.first_token = None
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.start_time
+        self.text += token
+        self.container.markdown(self.text + "▌")
+
+@st.cache_resource
+def get_llms():
+    # Model objects are shared by every session and use the shared connection pool.
+    # Only the answer is streamed, the question rewriting step uses a non streaming model.
+    # The chain runs with acall on the service loop, so the async pool is the one in use.
+    llm = ChatOpenAI(temperature=0, streaming=True, http_client=get_http_client(), http_async_client=get_http_async_client())
+    condense_question_llm = ChatOpenAI(temperature=0, http_client=get_http_client(), http_async_client=get_http_async_client())
+    return llm, condense_question_llm
+
+class PromptCounter(AsyncCallbackHandler):
+    # Counts the prompt tokens of every model call (question rewriting and answer)
+
+    async def on_chat_model_start(self, serialized, messages, **kwargs):
+        TELEMETRY.count("prompt_tokens", sum(count_message_tokens(prompt) for prompt in messages))
+
+class QueueHandler(PromptCounter):
+    # Puts the answer tokens in an asyncio queue, the service streams them to the page
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    async def on_llm_new_token(self, token, **kwargs):
+        await self.tokens.put(token)
+
+def format_chat_history(chat_turns):
+    return "".join(f"\nHuman: {question}\nAssistant: {answer}" for question, answer in chat_turns)
+
+async def condense_question(question, chat_turns):
+    # The standalone question the chain would search for, the same prompt and model the chain uses. The page
+    # looks it up in the answer cache, then passes it to the chain without history, so it is not rewritten twice.
+    if not chat_turns:
+        return question
+    _, condense_question_llm = get_llms()
+    prompt = CONDENSE_QUESTION_PROMPT.format(question=question, chat_history=format_chat_history(chat_turns))
+    response = await condense_question_llm.ainvoke(prompt, config={"callbacks": [PromptCounter()]})
+    return response.content
+
+async def stream_answer(conversation, question, result):
+    # Runs the chain on the service loop and yields the answer tokens, the full response is left in result.
+    # The question is standalone already, so the chain gets no history and does not rewrite it again.
+    tokens = asyncio.Queue()
+    task = asyncio.ensure_future(conversation.acall({'question': question, 'chat_history': []}, callbacks=[QueueHandler(tokens)]))
+    try:
+        while True:
+            token = asyncio.ensure_future(tokens.get())
+            done, _ = await asyncio.wait({token, task}, return_when=asyncio.FIRST_COMPLETED)
+            if token not in done:
+                token.cancel()
+                break
+            yield token.result()
+        while not tokens.empty():
+            yield tokens.get_nowait()
+        result['response'] = task.result()
+    finally:
+        task.cancel()
+
+def get_conversation_chain(vectorstore, lexical_index, k, vector_weight, lexical_weight):
+    llm, condense_question_llm = get_llms()
+    # Dense search alone misses exact names, so its ranking is fused with a BM25 keyword ranking
+    retriever = HybridRetriever(
+        vectorstore=vectorstore,
+        lexical_index=lexical_index,
+        k=k,
+        vector_weight=vector_weight,
+        lexical_weight=lexical_weight
+    )
+    conversation_chain = ConversationalRetrievalChain.from_llm(
+        llm=llm,
+        retriever=retriever,
+        condense_question_llm=condense_question_llm,
+        return_source_documents=True
+    )
+    return conversation_chain
@@ -0,0 +1,133 @@
+import csv
+import itertools
+import os
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+# Size of the blocks read from a CSV file, bounds the memory used no matter how many rows it has
+CSV_BLOCK_BYTES = 1 << 20
+
+# Rows per table batch when a file is read with csv.reader instead of pyarrow
+CSV_FALLBACK_BATCH_ROWS = 10_000
+
+# Target size of a row group chunk including the repeated header, roughly one chunk token budget
+CSV_CHUNK_CHARS = 800
+
+# Values that can be used for numeric aggregates, anything else is ignored
+NUMBER_PATTERN = r"^[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?$"
+
+AGGREGATE_OPERATIONS = ["count", "distinct", "sum", "mean", "min", "max"]
+
+def fit_row(row, n_columns):
+    # Pads a short row with empty values, the values of a long row beyond the last column are kept in the last one
+    if len(row) > n_columns:
+        return row[:n_columns - 1] + [",".join(row[n_columns - 1:])]
+    return row + [""] * (n_columns - len(row))
+
+def iter_csv_batches(path, schema):
+    # Record batches of every row with all the columns as text. pyarrow reads the file in blocks; when it rejects
+    # a row (e.g. fewer values than the header), the rows after the last complete block are read with csv.reader,
+    # which accepts any row like the original parser did.
+    n_rows = 0
+    try:
+        reader = pa_csv.open_csv(
+            path,
+            read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_BYTES),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={field.name: pa.string() for field in schema},
+                strings_can_be_null=False,
+                quoted_strings_can_be_null=False
+            )
+        )
+        for batch in reader:
+            n_rows += batch.num_rows
+            yield batch
+        return
+    except pa.ArrowInvalid:
+        pass
+
+    # The header and the rows already yielded are skipped, pyarrow skips empty lines so they are not counted either
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        csv_rows = itertools.islice((row for row in itertools.islice(csv.reader(f), 1, None) if row), n_rows, None)
+        while rows := [fit_row(row, len(schema)) for row in itertools.islice(csv_rows, CSV_FALLBACK_BATCH_ROWS)]:
+            yield pa.RecordBatch.from_arrays([pa.array(column, pa.string()) for column in zip(*rows)], schema=schema)
+
+def iter_csv_records(path, table_path=None):
+    # Streams a CSV file in blocks and yields ({"row_start", "row_end"}, text) row groups that start with the header.
+    # If table_path is given the same blocks are written to an Arrow file used for exact-match and aggregate queries.
+    # Excel saves UTF-8 files with a byte order mark, it is not part of the first column name.
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        header = next(csv.reader(f), None)
+    if not header:
+        return
+    header_line = ",".join(header)
+
+    # Every column is read as text, numbers are only parsed when an aggregate needs them
+    schema = pa.schema([(name, pa.string()) for name in header])
+
+    # The table is written next to its final path and only moved there once complete
+    writer = None
+    if table_path:
+        os.makedirs(os.path.dirname(table_path), exist_ok=True)
+        writer = pa.ipc.new_file(table_path + ".tmp", schema)
+
+    try:
+        lines, row_start, row_number, size = [], 1, 0, len(header_line)
+        for batch in iter_csv_batches(path, schema):
+            if writer:
+                writer.write_batch(batch)
+            for values in zip(*(column.to_pylist() for column in batch.columns)):
+                row_number += 1
+                line = ",".join("" if value is None else str(value) for value in values)
+                if lines and size + len(line) > CSV_CHUNK_CHARS:
+                    yield {"row_start": row_start, "row_end": row_number - 1}, "\n".join([header_line] + lines)
+                    lines, row_start, size = [], row_number, len(header_line)
+                lines.append(line)
+                size += len(line) + 1
+        if lines:
+            yield {"row_start": row_start, "row_end": row_number}, "\n".join([header_line] + lines)
+
+        if writer:
+            writer.close()
+            writer = None
+            os.replace(table_path + ".tmp", table_path)
+    finally:
+        if writer:
+            writer.close()
+            os.remove(table_path + ".tmp")
+
+def read_table(table_path):
+    # The Arrow file is memory mapped, so only the columns a query touches are paged in
+    with pa.memory_map(table_path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+def get_table_columns(table_path):
+    with pa.memory_map(table_path) as source:
+        return pa.ipc.open_file(source).schema.names
+
+def find_rows(table_path, column, value, limit=100):
+    # Rows whose column is exactly the value (ignoring surrounding spaces), plus the total number of matches
+    table = read_table(table_path)
+    mask = pc.equal(pc.utf8_trim_whitespace(table[column]), value.strip())
+    matches = table.filter(mask)
+    return matches.slice(0, limit), matches.num_rows
+
+def aggregate_column(table_path, column, operation):
+    values = pc.utf8_trim_whitespace(read_table(table_path)[column])
+    if operation == "count":
+        return pc.sum(pc.not_equal(values, "")).as_py() or 0
+    if operation == "distinct":
+        return pc.count_distinct(values).as_py()
+
+    # Numeric aggregates skip empty and non numeric cells
+    numbers = pc.cast(pc.if_else(pc.match_substring_regex(values, NUMBER_PATTERN), values, pa.scalar(None, pa.string())), pa.float64())
+    if operation == "sum":
+        return pc.sum(numbers).as_py()
+    if operation == "mean":
+        return pc.mean(numbers).as_py()
+    if operation == "min":
+        return pc.min(numbers).as_py()
+    if operation == "max":
+        return pc.max(numbers).as_py()
+    raise ValueError(f"Unknown operation: {operation}")
@@ -0,0 +1,37 @@
+import os
+import streamlit as st
+from telemetry import TELEMETRY
+
+# Get the project name to use in path variables
+project_folder_name = os.path.basename(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))  # Three levels up
+
+# cProfile dumps of the profiled reruns, open them with snakeviz or pstats
+PROFILES_DIR = os.path.join("..", project_folder_name, "data", "profiles")
+
+def is_profiling():
+    # Read before the page runs. Streamlit drops the state of a widget that is not shown, so the toggle
+    # copies its value to a key of its own that stays set while the panel is closed.
+    return st.session_state.get("profile_requests", False)
+
+def set_profiling():
+    st.session_state["profile_requests"] = st.session_state["profile_requests_toggle"]
+
+def show_debug_panel():
+    # Optional sidebar panel with the stage timings and counters of the process, their exports and the cProfile toggle
+    with st.sidebar:
+        if not st.checkbox("Show debug panel", key="show_debug_panel"):
+            return
+        with st.expander("Debug", expanded=True):
+            st.dataframe(TELEMETRY.get_stage_rows(), hide_index=True)
+            st.dataframe([{"counter": name, "value": value} for name, value in TELEMETRY.get_counters().items()], hide_index=True)
+            st.download_button("Export JSON", TELEMETRY.export_json(), file_name="telemetry.json", mime="application/json")
+            st.download_button("Export Prometheus", TELEMETRY.export_prometheus(), file_name="metrics.prom", mime="text/plain")
+            st.toggle(
+                "Profile every rerun with cProfile",
+                value=is_profiling(),
+                key="profile_requests_toggle",
+                on_change=set_profiling,
+                help=f"Dumps are written to {PROFILES_DIR}"
+            )
+            if st.button("Reset telemetry"):
+                TELEMETRY.reset()
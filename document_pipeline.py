@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+import sys
+import types
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Number of PDF pages parsed by one worker job, keeps every job result small
+PDF_PAGES_PER_JOB = 25
+
+# Jobs waiting in the pool per worker, bounds the text held in memory at any time
+JOBS_IN_FLIGHT_PER_WORKER = 2
+
+def extract_job(path, start, stop):
+    # Runs inside a worker process and returns a list of (location, text) records for one slice of a file,
+    # location is a dict with the page of the text inside the file when the format has pages
+    file_path = Path(path)
+    records = []
+
+    # If PDF then uses Pdf Reader, only the pages of this job.
+    # The parsers are imported by the format that needs them, a session without PDFs never loads PyPDF2.
+    if(file_path.suffix == ".pdf"):
+        from PyPDF2 import PdfReader
+        pdf_reader = PdfReader(path)
+        for page_number in range(start, stop):
+            text = pdf_reader.pages[page_number].extract_text() or ""
+            records.append(({"page": page_number + 1}, text))
+
+    # if .txt then the whole file is a single record
+    elif(file_path.suffix == ".txt"):
+        with open(path, "rb") as f:
+            records.append(({}, f.read().decode()))
+
+    # if word file then uses python-docx library
+    elif(file_path.suffix == ".docx"):
+        import docx
+        word_doc = docx.Document(path)
+        records.append(({}, "\n\n".join(para.text for para in word_doc.paragraphs if para.text.strip())))
+
+    return records
+
+def get_mp_context():
+    # The app runs threads (service loop, greetings, speech, the web server), a worker forked from it could inherit
+    # a lock held by one of them and hang. The fork server is a separate single threaded process the workers are
+    # forked from, it imports the parsers once so that the workers do not import them for their first job.
+    # Windows only has spawn, there every worker imports the parsers of its first job.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["document_pipeline", "PyPDF2", "docx"] + get_main_imports())
+        return context
+    return multiprocessing.get_context("spawn")
+
+def get_main_imports():
+    # Modules the main module imported names from. Every worker runs the main module again before its first job,
+    # the fork server does not preload it even when asked to. With these imported once by the server the workers
+    # inherit them, and running the main module again only takes the time of its own code.
+    main_module = sys.modules["__main__"]
+    names = set()
+    for value in vars(main_module).values():
+        name = value.__name__ if isinstance(value, types.ModuleType) else getattr(value, "__module__", None)
+        if isinstance(name, str) and not name.startswith("__") and name != "builtins":
+            names.add(name)
+    return sorted(names)
+
+def get_jobs(path):
+    # PDFs are split by page ranges so a single big file is parsed by several workers
+    if Path(path).suffix == ".pdf":
+        from PyPDF2 import PdfReader
+        page_count = len(PdfReader(path).pages)
+        return [(path, start, min(start + PDF_PAGES_PER_JOB, page_count)) for start in range(0, page_count, PDF_PAGES_PER_JOB)]
+    return [(path, 0, 0)]
+
+def iter_document_records(files, max_workers=None, on_error=None, tables_dir=None):
+    # Parses (document, path) pairs in a process pool and yields (document, location, text) records.
+    # Records come out in document and page order while later jobs are still being parsed.
+    # A failing document is reported to on_error and skipped, the other documents are not affected.
+    # CSV files are streamed in this process by pyarrow, and saved as <tables_dir>/<document>.arrow if tables_dir is given.
+    # pyarrow is imported here, not by the module, so the workers do not load it.
+    from csv_tables import iter_csv_records
+    max_workers = max_workers or os.cpu_count() or 1
+    failed = set()
+
+    def report(document, error):
+        failed.add(document)
+        if on_error is None:
+            raise error
+        on_error(document, error)
+
+    def iter_jobs():
+        for document, path in files:
+            if Path(path).suffix == ".csv":
+                yield document, path, None
+                continue
+            try:
+                jobs = get_jobs(path)
+            except Exception as e:
+                report(document, e)
+                continue
+            for job in jobs:
+                yield document, path, job
+
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_mp_context()) as executor:
+        pending = deque()
+        jobs = iter_jobs()
+        while True:
+            # Keep a bounded window of submitted jobs and consume them in submission order
+            while len(pending) < max_workers * JOBS_IN_FLIGHT_PER_WORKER:
+                job = next(jobs, None)
+                if job is None:
+                    break
+                document, path, args = job
+                pending.append((document, path, executor.submit(extract_job, *args) if args else None))
+            if not pending:
+                break
+
+            # CSV row groups are yielded directly from the stream while the workers keep parsing the next jobs
+            document, path, future = pending.popleft()
+            if future is None:
+                table_path = os.path.join(tables_dir, f"{document}.arrow") if tables_dir else None
+                try:
+                    for location, text in iter_csv_records(path, table_path):
+                        yield document, location, text
+                except Exception as e:
+                    report(document, e)
+                continue
+
+            try:
+                records = future.result()
+            except Exception as e:
+                if document not in failed:
+                    report(document, e)
+                continue
+            if document in failed:
+                continue
+            for location, text in records:
+                yield document, location, text
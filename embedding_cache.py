@@ -0,0 +1,129 @@
+import hashlib
+import random
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+
+# Tunables for the requests sent to the embedding model on cache misses
+EMBED_BATCH_SIZE = 256
+EMBED_CONCURRENCY = 4
+EMBED_MAX_RETRIES = 5
+EMBED_BACKOFF_SECONDS = 1.0
+
+# Stats of a thread that has not embedded anything yet
+EMPTY_STATS = {"chunks": 0, "hits": 0, "misses": 0, "hit_rate": 0.0, "seconds": 0.0, "chunks_per_second": 0.0}
+
+def is_transient_error(error):
+    # Rate limits, timeouts, dropped connections and server errors are worth another try, a bad request or key is not
+    import openai
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+class CachedEmbeddings(Embeddings):
+    # Embeddings wrapper that stores every chunk vector in SQLite under the hash of its text,
+    # so repeated chunks (headers, boilerplate, re-uploaded files) are never embedded twice
+
+    def __init__(self, embeddings, db_path, namespace="",
+                 batch_size=EMBED_BATCH_SIZE, concurrency=EMBED_CONCURRENCY,
+                 max_retries=EMBED_MAX_RETRIES, backoff_seconds=EMBED_BACKOFF_SECONDS):
+        self.embeddings = embeddings
+        self.namespace = namespace
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        # The wrapper is shared by every session of the process, the stats of the last call are kept per thread
+        # so that a session reads its own call and not the one of another session embedding at the same time
+        self._local = threading.local()
+
+        # Streamlit reruns the script in different threads, so the connection is shared behind a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    @property
+    def last_stats(self):
+        return getattr(self._local, "stats", EMPTY_STATS)
+
+    def _key(self, text):
+        # The namespace (usually the model name) keeps vectors of different models apart
+        return hashlib.sha256(f"{self.namespace}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys):
+        found = {}
+        with self._lock:
+            # SQLite limits the number of bound parameters, so the lookup is done in slices
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def _store(self, vectors_by_key):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in vectors_by_key.items()],
+            )
+            self._conn.commit()
+
+    def _embed_batch(self, texts):
+        # Retries rate limits and transient errors with exponential backoff and jitter, other errors are raised at once
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries or not is_transient_error(e):
+                    raise
+                time.sleep(self.backoff_seconds * (2 ** attempt) * (1 + random.random()))
+
+    def embed_documents(self, texts):
+        start_time = time.perf_counter()
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(list(set(keys)))
+
+        # Each missing text is embedded once even if it appears several times in the input
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            missing_keys = list(missing)
+            batches = [missing_keys[i:i + self.batch_size] for i in range(0, len(missing_keys), self.batch_size)]
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                results = executor.map(lambda batch: self._embed_batch([missing[key] for key in batch]), batches)
+                for batch, vectors in zip(batches, results):
+                    # Vectors are kept as float32 like FAISS does, so fresh and cached results are identical
+                    new_vectors = {key: array("f", vector).tolist() for key, vector in zip(batch, vectors)}
+                    self._store(new_vectors)
+                    cached.update(new_vectors)
+
+        # Report how much work the cache saved for this call
+        seconds = time.perf_counter() - start_time
+        hits = len(texts) - sum(1 for key in keys if key in missing)
+        self._local.stats = {
+            "chunks": len(texts),
+            "hits": hits,
+            "misses": len(texts) - hits,
+            "hit_rate": hits / len(texts) if texts else 0.0,
+            "seconds": seconds,
+            "chunks_per_second": len(texts) / seconds if seconds > 0 else 0.0,
+        }
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
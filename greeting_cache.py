@@ -0,0 +1,87 @@
+import hashlib
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Greetings kept in memory, the least recently used one is dropped first
+GREETING_CACHE_SIZE = 256
+# A greeting is generated again after this many seconds, it may mention the time of day or upcoming reminders
+GREETING_TTL_SECONDS = 6 * 60 * 60
+GREETING_WORKERS = 2
+
+# Shown instantly while the personalized greeting is generated
+FALLBACK_GREETINGS = {
+    "English": "Hi! How can I help you today with your reminders, tasks or plans?",
+    "Spanish": "¡Hola! ¿En qué te puedo ayudar hoy con tus recordatorios, tareas o planes?",
+    "Dutch": "Hoi! Waarmee kan ik je vandaag helpen met je herinneringen, taken of plannen?",
+    "Japanese": "こんにちは！今日はリマインダー、タスク、予定について何をお手伝いしましょうか？",
+    "French": "Bonjour ! Comment puis-je t'aider aujourd'hui avec tes rappels, tâches ou projets ?",
+    "Italian": "Ciao! Come posso aiutarti oggi con i tuoi promemoria, compiti o programmi?",
+}
+
+def get_greeting_key(user_memory, language):
+    return hashlib.sha256(f"{language}\0{user_memory}".encode('utf-8')).hexdigest()
+
+def get_fallback_greeting(language):
+    return FALLBACK_GREETINGS.get(language, FALLBACK_GREETINGS["English"])
+
+class GreetingCache:
+    # Thread safe LRU cache with a TTL, shared by every session. Missing greetings are generated in background threads,
+    # a key that is already being generated is not submitted twice.
+
+    def __init__(self, max_entries=GREETING_CACHE_SIZE, ttl_seconds=GREETING_TTL_SECONDS, max_workers=GREETING_WORKERS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        # Error of the last failed generation of a key, the sessions waiting for that greeting show it
+        self._errors = OrderedDict()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="greeting")
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created, greeting = entry
+            if time.monotonic() - created > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return greeting
+
+    def put(self, key, greeting):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), greeting)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generate(self, key, function):
+        # Runs function() in the background and caches its result under key
+        with self._lock:
+            if key in self._in_flight:
+                return
+            self._in_flight.add(key)
+            self._errors.pop(key, None)
+        self._executor.submit(self._generate, key, function)
+
+    def get_error(self, key):
+        with self._lock:
+            return self._errors.get(key)
+
+    def _generate(self, key, function):
+        try:
+            self.put(key, function())
+        except Exception as e:
+            traceback.print_exc()
+            with self._lock:
+                self._errors[key] = e
+                while len(self._errors) > self.max_entries:
+                    self._errors.popitem(last=False)
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
@@ -0,0 +1,125 @@
+import json
+import math
+import re
+from collections import Counter
+from typing import Any, List
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from telemetry import TELEMETRY
+
+# BM25 parameters, the usual defaults
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Constant of the reciprocal rank fusion, higher values flatten the difference between ranks
+RRF_K = 60
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+def get_term_frequencies(texts_by_id):
+    # {chunk_id: {term: count}}, this is what gets persisted next to every document index
+    return {chunk_id: dict(Counter(tokenize(text))) for chunk_id, text in texts_by_id.items()}
+
+def save_term_frequencies(path, term_frequencies):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(term_frequencies, f)
+
+def load_term_frequencies(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+class LexicalIndex:
+    # BM25 inverted index that supports adding and removing chunks by id, like the FAISS vectorstore
+
+    def __init__(self):
+        self.postings = {}
+        self.chunk_terms = {}
+        self.chunk_lengths = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.chunk_lengths)
+
+    def add(self, term_frequencies):
+        for chunk_id, terms in term_frequencies.items():
+            if chunk_id in self.chunk_terms:
+                continue
+            self.chunk_terms[chunk_id] = terms
+            length = sum(terms.values())
+            self.chunk_lengths[chunk_id] = length
+            self.total_length += length
+            for term, count in terms.items():
+                self.postings.setdefault(term, {})[chunk_id] = count
+
+    def remove(self, ids):
+        for chunk_id in ids:
+            terms = self.chunk_terms.pop(chunk_id, None)
+            if terms is None:
+                continue
+            self.total_length -= self.chunk_lengths.pop(chunk_id)
+            for term in terms:
+                postings = self.postings[term]
+                del postings[chunk_id]
+                if not postings:
+                    del self.postings[term]
+
+    def search(self, query, k=4):
+        # Returns the k best (chunk_id, score) pairs for the query
+        chunk_count = len(self.chunk_lengths)
+        if not chunk_count:
+            return []
+        average_length = self.total_length / chunk_count
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (chunk_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, count in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.chunk_lengths[chunk_id] / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * count * (BM25_K1 + 1) / (count + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+def dense_search(vectorstore, query, k=4):
+    # Ids of the k nearest chunks in the FAISS index, in rank order
+    if vectorstore.index.ntotal == 0:
+        return []
+    vector = np.array([vectorstore.embedding_function.embed_query(query)], dtype=np.float32)
+    _, positions = vectorstore.index.search(vector, min(k, vectorstore.index.ntotal))
+    return [vectorstore.index_to_docstore_id[position] for position in positions[0] if position != -1]
+
+def fuse_rankings(rankings, weights, k):
+    # Weighted reciprocal rank fusion of several ranked id lists
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + weight / (RRF_K + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+class HybridRetriever(BaseRetriever):
+    # Retriever that fuses the FAISS (dense) and BM25 (lexical) rankings of the same chunks
+
+    vectorstore: Any
+    lexical_index: Any
+    k: int = 4
+    fetch_k: int = 20
+    vector_weight: float = 0.5
+    lexical_weight: float = 0.5
+
+    def get_ranked_ids(self, query):
+        fetch_k = max(self.fetch_k, self.k)
+        dense_ids = dense_search(self.vectorstore, query, fetch_k) if self.vector_weight > 0 else []
+        lexical_ids = [chunk_id for chunk_id, _ in self.lexical_index.search(query, fetch_k)] if self.lexical_weight > 0 else []
+        return fuse_rankings([dense_ids, lexical_ids], [self.vector_weight, self.lexical_weight], self.k)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        with TELEMETRY.span("retrieve", k=self.k) as span:
+            documents = [self.vectorstore.docstore.search(chunk_id) for chunk_id in self.get_ranked_ids(query)]
+            documents = [document for document in documents if isinstance(document, Document)]
+            span["documents"] = len(documents)
+        return documents
@@ -0,0 +1,146 @@
+import json
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+# Sections of the user memory and the title used when it is shown to the LLM
+SECTIONS = {
+    "details": "User details",
+    "hobbies": "Hobbies",
+    "reminders": "Reminders",
+    "tasks": "Pending tasks",
+    "gym_schedule": "Gym schedule",
+}
+
+# Words that make a section relevant for a prompt, details are always relevant
+SECTION_KEYWORDS = {
+    "hobbies": ["hobby", "hobbies", "enjoy", "like", "love", "free time", "weekend", "music", "book", "movie", "game"],
+    "reminders": ["remind", "reminder", "appointment", "meeting", "call", "date", "time", "today", "tomorrow", "tonight", "week", "deadline", "birthday", "when", "schedule"],
+    "tasks": ["task", "todo", "to-do", "to do", "pending", "finish", "done", "need to", "have to", "must", "today", "tomorrow", "week", "plan"],
+    "gym_schedule": ["gym", "workout", "training", "train", "exercise", "fitness", "run", "running", "swim", "yoga", "schedule"],
+}
+
+# Upper bound of operations applied from a single completion, protects the memory from a runaway response
+MAX_OPERATIONS = 50
+
+def get_relevant_sections(text):
+    # Sections whose keywords appear in the text, all of them if none matches (e.g. other languages)
+    text = text.lower()
+    sections = ["details"] + [section for section, words in SECTION_KEYWORDS.items() if any(word in text for word in words)]
+    return sections if len(sections) > 1 else list(SECTIONS)
+
+def parse_operations(text):
+    # The completion should be a JSON array, anything around it (like code fences) is ignored
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end < start:
+        return []
+    try:
+        operations = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return []
+    return [operation for operation in operations if isinstance(operation, dict)]
+
+def parse_item_id(value):
+    # Item ids come from the completion, an int or a string of digits like "12", anything else is None.
+    # SQLite integers are 64-bit, a larger number cannot be an id either.
+    if isinstance(value, str) and re.fullmatch(r"[0-9]+", value.strip()):
+        value = int(value)
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value < 1 << 63:
+        return value
+    return None
+
+def parse_legacy_memory(text):
+    # Items of a memory written in the old user-memory.txt format ("- Reminders:" followed by indented lines)
+    titles = {title.lower(): section for section, title in SECTIONS.items()}
+    items, section = [], None
+    for line in text.splitlines():
+        stripped = line.strip().lstrip("-*").strip()
+        if not stripped:
+            continue
+        heading = stripped.rstrip(":").lower()
+        if stripped.endswith(":") and heading in titles:
+            section = titles[heading]
+        elif heading.startswith("last date modified"):
+            continue
+        elif ":" in stripped and stripped.split(":", 1)[0].strip().lower() in titles:
+            # "- Hobbies: reading, chess" on a single line
+            title, content = stripped.split(":", 1)
+            if content.strip():
+                items.append((titles[title.strip().lower()], content.strip()))
+            section = titles[title.strip().lower()]
+        elif section and not re.fullmatch(r"\(.*\)", stripped):
+            items.append((section, stripped))
+    return items
+
+class MemoryStore:
+    # User memory kept as small items per section in SQLite, changed with add/update/delete operations
+    # instead of rewriting the whole memory
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY AUTOINCREMENT, section TEXT NOT NULL, content TEXT NOT NULL, updated_at TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+
+    def items(self, sections=None):
+        sections = list(sections or SECTIONS)
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT id, section, content, updated_at FROM items WHERE section IN ({','.join('?' * len(sections))}) ORDER BY id",
+                sections
+            ).fetchall()
+
+    def import_items(self, items):
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO items (section, content, updated_at) VALUES (?, ?, ?)",
+                [(section, content, now) for section, content in items if section in SECTIONS]
+            )
+
+    def apply_operations(self, operations):
+        # Applies the valid operations in one transaction and returns how many changed the memory.
+        # Malformed operations are skipped before they reach SQLite, so they cannot roll back the valid ones.
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        applied = 0
+        with self._lock, self._conn:
+            for operation in operations[:MAX_OPERATIONS]:
+                op = operation.get("op")
+                # Only text is stored, a null or a number is treated as missing content
+                content = operation.get("content")
+                content = content.strip() if isinstance(content, str) else ""
+                item_id = parse_item_id(operation.get("id"))
+                if op == "add" and isinstance(operation.get("section"), str) and operation["section"] in SECTIONS and content:
+                    cursor = self._conn.execute(
+                        "INSERT INTO items (section, content, updated_at) VALUES (?, ?, ?)",
+                        (operation["section"], content, now)
+                    )
+                elif op == "update" and item_id is not None and content:
+                    cursor = self._conn.execute(
+                        "UPDATE items SET content = ?, updated_at = ? WHERE id = ?",
+                        (content, now, item_id)
+                    )
+                elif op == "delete" and item_id is not None:
+                    cursor = self._conn.execute("DELETE FROM items WHERE id = ?", (item_id,))
+                else:
+                    continue
+                applied += cursor.rowcount
+        return applied
+
+    def render(self, sections=None):
+        # Text shown to the LLM, every item keeps its id so it can be updated or deleted later
+        sections = list(sections or SECTIONS)
+        items = self.items(sections)
+        last_modified = max((updated_at for _, _, _, updated_at in items), default="-")
+        lines = [f"- Last date modified: {last_modified}"]
+        for section in sections:
+            lines.append(f"- {SECTIONS[section]} ({section}):")
+            lines += [f"    [{item_id}] {content}" for item_id, item_section, content, _ in items if item_section == section]
+        return "\n".join(lines)
@@ -0,0 +1,16 @@
+import os
+import tempfile
+
+def write_file_atomic(full_path, text):
+    # Writes to a temporary file in the same folder and renames it, readers never see a partial file
+    directory = os.path.dirname(full_path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(full_path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(text.encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, full_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,41 @@
+import os
+import streamlit as st
+from assistant_service import AssistantService
+
+# Get the project name to use in path variables
+project_folder_name = os.path.basename(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))  # Three levels up
+
+# Connections kept open to the OpenAI API, shared by every session of the process
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+
+@st.cache_resource
+def get_http_client():
+    # One connection pool for the OpenAI client and the LangChain models, a new request reuses an open
+    # TLS connection instead of connecting again. DefaultHttpxClient keeps the timeouts of the OpenAI SDK.
+    # The SDK is imported with the first client, not when a page starts.
+    import httpx
+    from openai import DefaultHttpxClient
+    return DefaultHttpxClient(
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS)
+    )
+
+@st.cache_resource
+def get_http_async_client():
+    # Pool of the async requests (astream, ainvoke, acall), LangChain models only use http_client for sync calls.
+    # The async requests all run on the loop of the assistant service, the connections stay on that loop.
+    import httpx
+    from openai import DefaultAsyncHttpxClient
+    return DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS)
+    )
+
+@st.cache_resource
+def get_openai_client(api_key=None):
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, http_client=get_http_client())
+
+@st.cache_resource
+def get_service():
+    # One service per process, shared by both pages, every user gets a memory folder under data/user-memory/users
+    return AssistantService(os.path.join("..", project_folder_name, "data", "user-memory", "users"))
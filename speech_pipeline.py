@@ -0,0 +1,108 @@
+import io
+import queue
+import re
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+# Synthesis requests running at the same time
+TTS_CONCURRENCY = 3
+# Short sentences are merged until they reach this length, fewer requests and a more natural voice
+MIN_SENTENCE_CHARS = 40
+# Extra time given to the browser before the next chunk replaces the one that is playing
+PLAYBACK_MARGIN_SECONDS = 0.15
+# Format of the raw PCM audio returned by the OpenAI speech endpoint
+TTS_SAMPLE_RATE = 24_000
+
+SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s+|\n\s*\n")
+
+def iter_sentences(chunks, min_chars=MIN_SENTENCE_CHARS):
+    # Groups streamed text chunks into sentences, a sentence is yielded as soon as the whitespace after it arrives
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        pieces = SENTENCE_END.split(buffer)
+        buffer = pieces.pop()
+        sentence = ""
+        for piece in pieces:
+            sentence = f"{sentence} {piece}".strip()
+            if len(sentence) >= min_chars:
+                yield sentence
+                sentence = ""
+        if sentence:
+            buffer = f"{sentence} {buffer}"
+    if buffer.strip():
+        yield buffer.strip()
+
+def synthesize_in_order(sentences, synthesize, max_workers=TTS_CONCURRENCY, on_error=None):
+    # A thread reads the sentences (and with them the LLM stream) and submits them to a pool,
+    # the audio of every sentence is yielded in order as soon as it and the ones before it are ready.
+    # With on_error, a sentence that fails to synthesize is reported and skipped instead of raising.
+    futures = queue.Queue()
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+
+    def produce():
+        try:
+            for sentence in sentences:
+                if stop.is_set():
+                    break
+                futures.put(executor.submit(synthesize, sentence))
+        except Exception as e:
+            futures.put(e)
+        finally:
+            futures.put(None)
+
+    threading.Thread(target=produce, name="tts-producer", daemon=True).start()
+    try:
+        while (item := futures.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            try:
+                audio = item.result()
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(e)
+                continue
+            yield audio
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def pcm_to_wav(pcm_bytes, sample_rate=TTS_SAMPLE_RATE):
+    # Mono 16-bit PCM in a WAV container, the duration of every chunk is then known before it is played
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm_bytes)
+    return buffer.getvalue()
+
+def get_wav_duration(audio_bytes):
+    with wave.open(io.BytesIO(audio_bytes), "rb") as wav:
+        return wav.getnframes() / wav.getframerate()
+
+def join_wav(chunks):
+    # One WAV file out of chunks with the same format, used to replay the whole answer
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as output:
+        for i, chunk in enumerate(chunks):
+            with wave.open(io.BytesIO(chunk), "rb") as wav:
+                if i == 0:
+                    output.setparams(wav.getparams())
+                output.writeframes(wav.readframes(wav.getnframes()))
+    return buffer.getvalue()
+
+def play_in_order(audio_chunks, play):
+    # Calls play(chunk) for every chunk once the previous one has finished playing, returns all the chunks
+    played, playing_until = [], 0.0
+    for chunk in audio_chunks:
+        time.sleep(max(0.0, playing_until - time.monotonic()))
+        play(chunk)
+        playing_until = time.monotonic() + get_wav_duration(chunk) + PLAYBACK_MARGIN_SECONDS
+        played.append(chunk)
+    time.sleep(max(0.0, playing_until - time.monotonic()))
+    return played
@@ -0,0 +1,135 @@
+import cProfile
+import concurrent.futures
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Upper bounds in seconds of the latency histogram buckets exported to Prometheus
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+# Spans kept for the debug panel and the JSON export
+RECENT_SPANS = 200
+METRIC_PREFIX = "chatwithpdfs"
+
+class Telemetry:
+    # Process wide, thread safe store of stage timings and counters. A stage (parse, embed, llm_total, ...)
+    # keeps a count, a sum and a latency histogram, counters add up tokens, bytes, chunks, ...
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._recent = deque(maxlen=RECENT_SPANS)
+
+    @contextmanager
+    def span(self, stage, **attributes):
+        # Times the block, the attributes dict can be filled inside it and is kept with the span
+        start_time = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            self.record(stage, time.perf_counter() - start_time, **attributes)
+
+    def record(self, stage, seconds, **attributes):
+        with self._lock:
+            stats = self._stages.setdefault(stage, {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(LATENCY_BUCKETS)})
+            stats["count"] += 1
+            stats["sum"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats["buckets"][i] += 1
+            self._recent.append({"stage": stage, "seconds": round(seconds, 6), "time": datetime.now().isoformat(timespec="seconds"), **attributes})
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def get_stage_rows(self):
+        with self._lock:
+            return [{"stage": stage, "count": stats["count"], "mean s": stats["sum"] / stats["count"], "max s": stats["max"], "total s": stats["sum"]}
+                    for stage, stats in sorted(self._stages.items())]
+
+    def get_counters(self):
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    def export_json(self):
+        with self._lock:
+            return json.dumps({
+                "stages": {stage: dict(stats, buckets=dict(zip(map(str, LATENCY_BUCKETS), stats["buckets"]))) for stage, stats in self._stages.items()},
+                "counters": dict(self._counters),
+                "recent_spans": list(self._recent),
+            }, indent=2, default=str)
+
+    def export_prometheus(self):
+        # Text exposition format, one histogram for the stages and one counter per name
+        lines = [f"# TYPE {METRIC_PREFIX}_stage_seconds histogram"]
+        with self._lock:
+            for stage, stats in sorted(self._stages.items()):
+                for bound, count in zip(LATENCY_BUCKETS, stats["buckets"]):
+                    lines.append(f'{METRIC_PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{METRIC_PREFIX}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {stats["count"]}')
+                lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{{stage="{stage}"}} {stats["sum"]}')
+                lines.append(f'{METRIC_PREFIX}_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+            for name, value in sorted(self._counters.items()):
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name}_total counter")
+                lines.append(f"{METRIC_PREFIX}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._recent.clear()
+
+# Shared by every module of the process
+TELEMETRY = Telemetry()
+
+def call_in_loop(loop, function):
+    # Runs function() in the thread of an asyncio loop and returns its result
+    future = concurrent.futures.Future()
+
+    def call():
+        try:
+            future.set_result(function())
+        except Exception as e:
+            future.set_exception(e)
+
+    loop.call_soon_threadsafe(call)
+    return future.result()
+
+def enable_profiler():
+    # Python 3.12 and later profile every thread with one profiler and refuse a second one, the profiler
+    # of the calling thread already covers the loop then
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
+
+@contextmanager
+def profile_request(enabled, profiles_dir, name, loop=None):
+    # With enabled, the block runs under cProfile and the stats are dumped to <profiles_dir>/<time>-<name>.prof.
+    # With loop, the thread of that asyncio loop is profiled for as long as the block runs and dumped to
+    # <time>-<name>-service.prof. The loop runs the model work of every session, so other sessions show up there too.
+    if not enabled:
+        yield None
+        return
+    os.makedirs(profiles_dir, exist_ok=True)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    service_profiler = call_in_loop(loop, enable_profiler) if loop is not None else None
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        path = os.path.join(profiles_dir, f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{name}")
+        profiler.dump_stats(f"{path}.prof")
+        if service_profiler is not None:
+            call_in_loop(loop, service_profiler.disable)
+            service_profiler.dump_stats(f"{path}-service.prof")
@@ -0,0 +1,135 @@
+import math
+import os
+import pickle
+# faiss, numpy and LangChain are imported by the functions that use them, the page only needs INDEX_TYPES to render
+
+# "auto" picks the index type from the number of vectors
+INDEX_TYPES = ["auto", "flat", "hnsw", "ivf", "ivfpq"]
+
+# Vector counts from which auto switches to the next index type
+HNSW_MIN_VECTORS = 20_000
+IVF_MIN_VECTORS = 200_000
+IVFPQ_MIN_VECTORS = 2_000_000
+
+# Search and build parameters of the approximate indexes
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 16
+PQ_MAX_SUBQUANTIZERS = 64
+MAX_TRAIN_VECTORS = 256_000
+
+# Below these counts there are not enough vectors to train the index, a simpler one is used instead
+IVF_MIN_TRAIN_VECTORS = 1_000
+PQ_MIN_TRAIN_VECTORS = 10_000
+
+def resolve_index_type(index_type, n_vectors):
+    if index_type != "auto":
+        if index_type == "ivfpq" and n_vectors < PQ_MIN_TRAIN_VECTORS:
+            index_type = "ivf"
+        if index_type == "ivf" and n_vectors < IVF_MIN_TRAIN_VECTORS:
+            index_type = "flat"
+        return index_type
+    if n_vectors >= IVFPQ_MIN_VECTORS:
+        return "ivfpq"
+    if n_vectors >= IVF_MIN_VECTORS:
+        return "ivf"
+    if n_vectors >= HNSW_MIN_VECTORS:
+        return "hnsw"
+    return "flat"
+
+def get_index_type(index):
+    import faiss
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+def get_factory_string(index_type, dim, n_vectors):
+    # Around 4 * sqrt(n) clusters, and as many PQ sub-quantizers as divide the dimension (up to 64)
+    nlist = max(1, min(65536, int(4 * math.sqrt(max(n_vectors, 1)))))
+    if index_type == "hnsw":
+        return f"HNSW{HNSW_M}"
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivfpq":
+        m = max(m for m in range(1, PQ_MAX_SUBQUANTIZERS + 1) if dim % m == 0)
+        return f"IVF{nlist},PQ{m}x8"
+    return "Flat"
+
+def create_index(index_type, dim, n_vectors):
+    import faiss
+    index = faiss.index_factory(dim, get_factory_string(index_type, dim, n_vectors))
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(IVF_NPROBE, index.nlist)
+    return index
+
+def read_index(index_path):
+    # The cached document indexes are memory mapped when read, their vectors are only paged in while copied
+    import faiss
+    return faiss.read_index(os.path.join(index_path, "index.faiss"), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0))
+
+def read_document_vectors(index_path):
+    # Vectors, docstore and position -> id mapping of a document index saved with FAISS.save_local
+    index = read_index(index_path)
+    with open(os.path.join(index_path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return index.reconstruct_n(0, index.ntotal), docstore, index_to_docstore_id
+
+def count_document_vectors(index_path):
+    return read_index(index_path).ntotal
+
+def add_document_vectors(vectorstore, index_path):
+    # Appends a cached document index to the vectorstore, works for every index type once it is trained
+    import numpy as np
+    vectors, docstore, index_to_docstore_id = read_document_vectors(index_path)
+    start = vectorstore.index.ntotal
+    vectorstore.index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    for position in range(len(index_to_docstore_id)):
+        chunk_id = index_to_docstore_id[position]
+        vectorstore.index_to_docstore_id[start + position] = chunk_id
+        vectorstore.docstore.add({chunk_id: docstore.search(chunk_id)})
+
+def sample_training_vectors(index_paths, counts, max_vectors=MAX_TRAIN_VECTORS):
+    # Every document gives a share of the sample proportional to its size, taken at evenly spaced positions,
+    # so the clusters are trained on all documents and all their sections instead of the first ones only
+    import numpy as np
+    n_vectors = sum(counts)
+    sample = []
+    for index_path, count in zip(index_paths, counts):
+        share = min(count, math.ceil(max_vectors * count / n_vectors))
+        if share:
+            positions = np.linspace(0, count - 1, share).astype(np.int64)
+            sample.append(read_index(index_path).reconstruct_batch(positions))
+    return np.vstack(sample)
+
+def build_vectorstore(embeddings, index_paths, index_type="auto"):
+    # Builds one vectorstore out of cached document indexes without embedding anything again.
+    # The approximate indexes are trained on a sample spread over all the documents.
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    counts, dim = [], None
+    for index_path in index_paths:
+        index = read_index(index_path)
+        counts.append(index.ntotal)
+        dim = index.d
+    if dim is None:
+        return None
+
+    n_vectors = sum(counts)
+    index = create_index(resolve_index_type(index_type, n_vectors), dim, n_vectors)
+    if not index.is_trained:
+        index.train(sample_training_vectors(index_paths, counts))
+    vectorstore = FAISS(embeddings, index, InMemoryDocstore(), {})
+    for index_path in index_paths:
+        add_document_vectors(vectorstore, index_path)
+    return vectorstore
+
+def get_index_memory(index):
+    # Size of the serialized index, close to what it takes in memory
+    import faiss
+    return faiss.serialize_index(index).nbytes